@@ -1,14 +1,39 @@
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.views.main import ChangeList
+from django.core.exceptions import PermissionDenied
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
 from django.utils.safestring import mark_safe
 
 from mymdb.admin import Admin
 
+from . import search, stats
+from .caching import GENRES, MOVIES, CachedCountQuerySet, cached, invalidate
 from .models import Genre, Movie
 
 
 @admin.action(description="Mark selected movies in store")
 def set_in_store(modeladmin, request, queryset):
-    queryset.update(in_store=True)
+    stats.update(queryset, in_store=True, updated_at=timezone.now())
+    invalidate(MOVIES)
+
+
+class GenreListFilter(admin.RelatedFieldListFilter):
+    def field_choices(self, field, request, model_admin):
+        ordering = self.field_admin_ordering(field, request, model_admin)
+        return cached(
+            f"admin:genre_choices:{ordering}",
+            lambda: super(GenreListFilter, self).field_choices(field, request, model_admin),
+            namespaces=(GENRES,),
+        )
+
+
+class MovieChangeList(ChangeList):
+    def get_queryset(self, request, *args, **kwargs):
+        # The list never shows awards, which can be long
+        return super().get_queryset(request, *args, **kwargs).defer("awards")
 
 
 @admin.register(Movie)
@@ -71,21 +96,59 @@ class MovieAdmin(Admin):
         "on_watchlist",
         "in_store",
     )
-    list_filter = ("on_watchlist", "in_store", "genres")
+    list_filter = ("on_watchlist", "in_store", ("genres", GenreListFilter))
     ordering = ("-imdb_rating", "-metascore")
     search_fields = ("title",)
 
+    def get_changelist(self, request, **kwargs):
+        return MovieChangeList
+
+    def get_urls(self):
+        return [
+            path("stats/", self.admin_site.admin_view(self.stats_view), name="movies_movie_stats"),
+            *super().get_urls(),
+        ]
+
+    def stats_view(self, request):
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        context = {
+            **self.admin_site.each_context(request),
+            "title": "Library statistics",
+            "opts": self.model._meta,
+            **stats.dashboard(),
+        }
+        return TemplateResponse(request, "admin/movies/movie/stats.html", context)
+
+    def get_queryset(self, request):
+        # The paginator and the result counts run a COUNT on every page
+        queryset = super().get_queryset(request)
+        return CachedCountQuerySet(model=queryset.model, query=queryset.query, using=queryset.db)
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search.terms(search_term):
+            return super().get_search_results(request, queryset, search_term)
+        # Words too short for the trigram index still have to be in the title
+        for term in search_term.split():
+            if len(term) < search.MIN_TERM_LENGTH:
+                queryset = queryset.filter(title__icontains=term)
+        return queryset.filter(pk__in=search.matching(search_term)), False
+
     def get_genres(self, obj):
-        return ", ".join([m.title for m in obj.genres.all()])
+        return obj.genre_titles
+
+    def poster_url(self, path, obj):
+        # Fall back to the remote poster until a local copy is downloaded
+        return f"{settings.MEDIA_URL}{path}" if path else obj.poster
 
     def image(self, obj):
-        return mark_safe(
-            f'<a href="https://www.imdb.com/title/{obj.imdb_id}"><img src="{obj.poster}"/></a>'
-        )
+        src = self.poster_url(obj.poster_file, obj)
+        return mark_safe(f'<a href="https://www.imdb.com/title/{obj.imdb_id}"><img src="{src}"/></a>')
 
     def thumb(self, obj):
+        src = self.poster_url(obj.poster_thumbnail, obj)
         return mark_safe(
-            f'<a href="https://www.imdb.com/title/{obj.imdb_id}"><img src="{obj.poster}" width="60"/></a>'
+            f'<a href="https://www.imdb.com/title/{obj.imdb_id}"><img src="{src}" width="60"/></a>'
         )
 
 
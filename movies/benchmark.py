@@ -0,0 +1,186 @@
+import random
+import re
+import resource
+import statistics
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from unittest import mock
+
+GENRES = ("Action", "Adventure", "Comedy", "Crime", "Drama", "Horror", "Romance", "Sci-Fi", "Thriller")
+
+
+class UpstreamError(Exception):
+    """
+    Error raised by the fake backend; it looks like an HTTP 503 to the engine.
+    """
+
+    def __init__(self):
+        super().__init__({"errcode": 503, "errmsg": "Service Unavailable"})
+
+
+def synthetic_movie(i):
+    """
+    Metadata of the i-th movie of a synthetic library.
+    """
+    rnd = random.Random(i)
+    return {
+        "id": f"{i + 1:07d}",
+        "title": f"Synthetic Movie {i}",
+        "year": 1950 + i % 70,
+        "runtime": rnd.randint(80, 180),
+        "genres": rnd.sample(GENRES, 2),
+        "language": "English",
+        "rating": round(rnd.uniform(1, 10), 1),
+        "metascore": rnd.randint(1, 100),
+        "poster": f"https://example.com/posters/{i}.jpg",
+    }
+
+
+def synthetic_index(title):
+    match = re.fullmatch(r"synthetic movie (\d+)", title.strip().lower())
+    return int(match.group(1)) if match else None
+
+
+class FakeMovie(dict):
+    def __init__(self, movie_id, data):
+        super().__init__(data)
+        self.movieID = movie_id
+
+
+class FakeBackend:
+    """
+    Local stand-in for IMDb and OMDb serving a synthetic library.
+
+    Every call sleeps ``latency`` seconds (with +/-50% jitter) and fails
+    with probability ``error_rate``, which the fetch engine retries like
+    a 503 from the real services.
+    """
+
+    def __init__(self, latency=0.05, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+
+    def call(self):
+        with self.lock:
+            self.calls += 1
+            delay = self.latency * self.random.uniform(0.5, 1.5)
+            failed = self.random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        time.sleep(delay)
+        if failed:
+            raise UpstreamError()
+
+    def imdb(self, *args, **kwargs):
+        backend = self
+
+        class FakeIMDb:
+            def search_movie(self, query, results=20):
+                backend.call()
+                i = synthetic_index(query)
+                if i is None:
+                    return []
+                movie = synthetic_movie(i)
+                return [FakeMovie(movie["id"], {"title": movie["title"], "year": movie["year"]})]
+
+            def get_movie(self, movie_id, info=()):
+                backend.call()
+                movie = synthetic_movie(int(movie_id) - 1)
+                return FakeMovie(
+                    movie_id,
+                    {
+                        "kind": "movie",
+                        "title": movie["title"],
+                        "year": movie["year"],
+                        "runtimes": [str(movie["runtime"])],
+                        "languages": [movie["language"]],
+                        "genres": movie["genres"],
+                        "cover url": movie["poster"],
+                        "rating": movie["rating"],
+                        "metascore": str(movie["metascore"]),
+                    },
+                )
+
+        return FakeIMDb()
+
+    def omdb(self, params, cache=None, session=None):
+        self.call()
+        if "i" in params:
+            i = int(params["i"][2:]) - 1
+        else:
+            i = synthetic_index(params["t"])
+            if i is None:
+                raise Exception("Movie not found!")
+        movie = synthetic_movie(i)
+        return {
+            "Response": "True",
+            "Type": "movie",
+            "imdbID": f"tt{movie['id']}",
+            "Title": movie["title"],
+            "Year": str(movie["year"]),
+            "Runtime": f"{movie['runtime']} min",
+            "Genre": ", ".join(movie["genres"]),
+            "Language": movie["language"],
+            "Poster": movie["poster"],
+            "Awards": "N/A",
+            "imdbRating": str(movie["rating"]),
+            "Metascore": str(movie["metascore"]),
+        }
+
+    @contextmanager
+    def installed(self):
+        """
+        Swap ``imdb.IMDb`` and ``movies.omdb._call_api`` for this backend.
+        """
+        with ExitStack() as stack:
+            stack.enter_context(mock.patch("imdb.IMDb", self.imdb))
+            stack.enter_context(mock.patch("movies.omdb._call_api", self.omdb))
+            yield self
+
+
+def peak_rss():
+    """
+    Peak resident set size of the process so far, in bytes.
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def summarize(latencies, duration, items):
+    latencies = sorted(latencies)
+    if len(latencies) > 1:
+        quantiles = statistics.quantiles(latencies, n=100, method="inclusive")
+        p50, p95 = quantiles[49], quantiles[94]
+    else:
+        p50 = p95 = latencies[0] if latencies else None
+    return {
+        "items": items,
+        "duration": duration,
+        "throughput": items / duration if duration else None,
+        "p50": p50,
+        "p95": p95,
+    }
+
+
+class Timer:
+    """
+    Record how long each call of a function takes, from any thread.
+    """
+
+    def __init__(self, func):
+        self.func = func
+        self.latencies = []
+        self.lock = threading.Lock()
+
+    def __call__(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self.func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.latencies.append(elapsed)
@@ -0,0 +1,124 @@
+import argparse
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+
+
+def duration(value):
+    """
+    Parse a duration like "90", "30m", "12h" or "7d" into seconds.
+    """
+    match = re.fullmatch(r"(?P<amount>\d+)(?P<unit>[smhd]?)", value.strip())
+    if not match:
+        raise argparse.ArgumentTypeError(f'Invalid duration "{value}"')
+    unit = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}[match["unit"]]
+    return int(match["amount"]) * unit
+
+
+class ResponseCache:
+    """
+    Persistent cache for upstream metadata responses.
+
+    Values are JSON-serializable objects stored in a local SQLite file under
+    the SHA-256 of their key. Every entry expires after ``ttl`` seconds and
+    the least recently used entries are evicted once ``max_entries`` is
+    exceeded. Entries older than ``max_age`` seconds are treated as misses
+    and refreshed.
+    """
+
+    evict_every = 100
+
+    def __init__(self, path, ttl, max_entries, max_age=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=20, check_same_thread=False, isolation_level=None)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "created_at REAL NOT NULL, accessed_at REAL NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+
+    @classmethod
+    def from_settings(cls, max_age=None):
+        return cls(
+            settings.METADATA_CACHE_PATH,
+            settings.METADATA_CACHE_TTL,
+            settings.METADATA_CACHE_MAX_ENTRIES,
+            max_age=max_age,
+        )
+
+    @staticmethod
+    def digest(key):
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        digest = self.digest(key)
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT value, created_at, expires_at FROM responses WHERE key = ?", (digest,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            value, created_at, expires_at = row
+            if expires_at < now or (self.max_age is not None and created_at < now - self.max_age):
+                self.conn.execute("DELETE FROM responses WHERE key = ?", (digest,))
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, digest))
+            self.hits += 1
+        return json.loads(value)
+
+    def set(self, key, value):
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "REPLACE INTO responses (key, value, created_at, accessed_at, expires_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (self.digest(key), json.dumps(value), now, now, now + self.ttl),
+            )
+            self.writes += 1
+            if self.writes % self.evict_every == 0:
+                self.evict()
+
+    def evict(self):
+        self.conn.execute("DELETE FROM responses WHERE expires_at < ?", (time.time(),))
+        self.conn.execute(
+            "DELETE FROM responses WHERE key IN ("
+            "SELECT key FROM responses ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def get_or_set(self, key, fetch):
+        value = self.get(key)
+        if value is None:
+            value = fetch()
+            self.set(key, value)
+        return value
+
+
+class NullCache:
+    """
+    Drop-in replacement for ``ResponseCache`` that never stores anything.
+    """
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value):
+        pass
+
+    def get_or_set(self, key, fetch):
+        return fetch()
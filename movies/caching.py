@@ -0,0 +1,72 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import QuerySet
+
+# Cached values depend on the movies, on the genres and which movies they
+# have, or both; changes bump the version of their namespace
+MOVIES = "movies"
+GENRES = "genres"
+NAMESPACES = (MOVIES, GENRES)
+
+
+def version_key(namespace):
+    return f"catalog:{namespace}:version"
+
+
+def versions(namespaces):
+    keys = [version_key(namespace) for namespace in namespaces]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            # Start from the clock so a wiped cache never reuses old versions
+            cache.add(key, int(time.time() * 1000), timeout=None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+def bump(namespaces):
+    for namespace in namespaces:
+        try:
+            cache.incr(version_key(namespace))
+        except ValueError:
+            versions([namespace])
+
+
+def invalidate(*namespaces):
+    """
+    Drop every cached value depending on the given namespaces (all of them
+    by default) once the current transaction commits, so a request running
+    meanwhile can't cache the old data under the new version.
+    """
+    transaction.on_commit(lambda: bump(namespaces or NAMESPACES))
+
+
+def cached(key, compute, namespaces=NAMESPACES):
+    """
+    Return the value cached under key for the current versions of the
+    namespaces, computing and caching it on a miss.
+    """
+    tags = [f"{namespace}.{version}" for namespace, version in zip(namespaces, versions(namespaces))]
+    versioned = ":".join(["catalog", *tags, key])
+    value = cache.get(versioned)
+    if value is None:
+        value = compute()
+        cache.set(versioned, value, settings.CATALOG_CACHE_TIMEOUT)
+    return value
+
+
+class CachedCountQuerySet(QuerySet):
+    """
+    Movie queryset whose counts are cached, as paginators count on every page.
+    """
+
+    def count(self):
+        if self._result_cache is not None:
+            return len(self._result_cache)
+        sql, params = self.query.sql_with_params()
+        key = hashlib.sha1(f"{sql}:{params}".encode()).hexdigest()
+        return cached(f"count:{key}", super().count)
@@ -0,0 +1,331 @@
+import asyncio
+import logging
+import queue
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from .metrics import Metrics
+
+logger = logging.getLogger(__name__)
+
+
+def status_code(exc):
+    """
+    Find the HTTP status code behind an upstream error, if there is one.
+    """
+    response = getattr(exc, "response", None)
+    if response is not None:
+        return response.status_code
+    # IMDbPY wraps urllib errors in IMDbDataAccessError({"errcode": ..., ...})
+    for arg in getattr(exc, "args", ()):
+        if isinstance(arg, dict) and isinstance(arg.get("errcode"), int):
+            return arg["errcode"]
+    code = getattr(exc, "code", None)
+    return code if isinstance(code, int) else None
+
+
+def is_retryable_code(code):
+    return isinstance(code, int) and (code == 429 or code >= 500)
+
+
+def is_retryable(exc):
+    return is_retryable_code(status_code(exc))
+
+
+def pooled_session(size):
+    """
+    A requests session keeping up to size connections open to every host.
+    """
+    # requests takes a while to import, runs that fetch nothing never load it
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=size, pool_maxsize=size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket allowing ``rate`` calls per second on average.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class RequestBudget:
+    """
+    Allow at most ``per_hour`` requests over any sliding hour.
+    """
+
+    window = 3600
+
+    def __init__(self, per_hour):
+        self.per_hour = per_hour
+        self.spent = deque()
+        self.total = 0
+        self.lock = threading.Lock()
+
+    def prune(self):
+        now = time.monotonic()
+        while self.spent and self.spent[0][0] <= now - self.window:
+            self.total -= self.spent.popleft()[1]
+
+    def delay(self, count):
+        """
+        Seconds until ``count`` requests fit in the budget; call it holding the lock.
+        """
+        self.prune()
+        if self.per_hour - self.total >= min(count, self.per_hour):
+            return 0.0
+        return max(0.0, self.spent[0][0] + self.window - time.monotonic())
+
+    def wait(self, count):
+        """
+        Block until ``count`` requests fit in the budget.
+        """
+        while True:
+            with self.lock:
+                delay = self.delay(count)
+            if not delay:
+                return
+            time.sleep(delay)
+
+    def acquire(self):
+        """
+        Block until one more request fits in the budget, and spend it.
+        """
+        while True:
+            with self.lock:
+                delay = self.delay(1)
+                if not delay:
+                    self.spent.append((time.monotonic(), 1))
+                    self.total += 1
+                    return
+            time.sleep(delay)
+
+
+class SingleFlight:
+    """
+    Run a call once per key, however many threads ask for it.
+
+    Threads asking for a key while its call runs wait for it and share its
+    result or exception. Results are kept for the life of the object (one
+    command run) so later requests don't call again; failures aren't, so
+    they can be retried.
+    """
+
+    def __init__(self, metrics=None):
+        self.metrics = metrics or Metrics(interval=0)
+        self.lock = threading.Lock()
+        self.futures = {}
+
+    def do(self, key, func, *args, **kwargs):
+        with self.lock:
+            future = self.futures.get(key)
+            owner = future is None
+            if owner:
+                future = self.futures[key] = Future()
+        if not owner:
+            self.metrics.coalesced()
+            return future.result()
+
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            with self.lock:
+                del self.futures[key]
+            future.set_exception(e)
+            raise
+        future.set_result(result)
+        return result
+
+    def seed(self, key, result):
+        """
+        Record the result of key, unless it is already known or running.
+        """
+        with self.lock:
+            if key not in self.futures:
+                future = self.futures[key] = Future()
+                future.set_result(result)
+
+
+class FetchEngine:
+    """
+    Run fetch tasks with bounded concurrency and paced upstream calls.
+
+    Tasks are scheduled by an asyncio loop on a background thread, which
+    keeps at most ``concurrency`` of them running in a thread pool, so
+    blocking clients (IMDbPY, requests) can be used as they are. Upstream
+    calls made through ``call`` are limited to ``rps`` per second for each
+    host and retried with exponential backoff and jitter on 429 and 5xx;
+    their latency and retries are recorded in ``metrics``. With a
+    ``budget``, each of them first waits for a request of the budget.
+    """
+
+    def __init__(self, concurrency=32, rps=10.0, retries=4, backoff=0.5, metrics=None, budget=None):
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        self.concurrency = concurrency
+        self.rps = rps
+        self.retries = retries
+        self.backoff = backoff
+        self.metrics = metrics or Metrics(interval=0)
+        self.budget = budget
+        self.buckets = defaultdict(lambda: TokenBucket(rps))
+        self.buckets_lock = threading.Lock()
+        self.session_lock = threading.Lock()
+        self._session = None
+
+    @property
+    def session(self):
+        with self.session_lock:
+            if self._session is None:
+                self._session = pooled_session(self.concurrency)
+        return self._session
+
+    def throttle(self, host):
+        if not self.rps:
+            return
+        with self.buckets_lock:
+            bucket = self.buckets[host]
+        bucket.acquire()
+
+    def call(self, host, func, *args, **kwargs):
+        """
+        Call func as an upstream request to host, pacing and retrying it.
+        """
+        for attempt in range(self.retries + 1):
+            if self.budget is not None:
+                self.budget.acquire()
+            self.throttle(host)
+            start = time.monotonic()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                self.metrics.observe_upstream(host, time.monotonic() - start)
+                if attempt == self.retries or not is_retryable(e):
+                    raise
+                code = status_code(e)
+            else:
+                self.metrics.observe_upstream(host, time.monotonic() - start)
+                # Plain requests responses don't raise on error statuses
+                code = getattr(result, "status_code", None)
+                if attempt == self.retries or not is_retryable_code(code):
+                    return result
+
+            delay = self.backoff * 2 ** attempt
+            delay = random.uniform(delay / 2, delay * 1.5)
+            self.metrics.retried(host)
+            logger.debug(f"{host} answered {code}, retrying in {delay:.2f}s")
+            time.sleep(delay)
+
+    def get(self, url, **kwargs):
+        """
+        GET url through the pooled session, paced and retried like ``call``.
+        """
+        return self.call(urlparse(url).netloc, self.session.get, url, **kwargs)
+
+    def map(self, func, items):
+        """
+        Run func over items and yield ``(item, future)`` pairs as they complete.
+
+        The futures are already done; calling ``result()`` returns the value
+        or raises the exception of the task. Items are consumed lazily so a
+        generator can keep feeding the engine while results are processed.
+        Closing the generator cancels the tasks that haven't started yet.
+        """
+        # A task keeps its slot until its result is taken, so at most
+        # ``concurrency`` results (and the end marker) are ever queued
+        results = queue.Queue(maxsize=self.concurrency + 1)
+        done = object()
+        running = {}
+
+        async def run(pool):
+            loop = asyncio.get_running_loop()
+            semaphore = asyncio.Semaphore(self.concurrency)
+            running.update(loop=loop, task=asyncio.current_task(), semaphore=semaphore)
+
+            async def task(item):
+                future = Future()
+                try:
+                    future.set_result(await loop.run_in_executor(pool, func, item))
+                except Exception as e:
+                    future.set_exception(e)
+                results.put((item, future))
+
+            tasks = set()
+            iterator = iter(items)
+            while True:
+                await semaphore.acquire()
+                try:
+                    item = await loop.run_in_executor(pool, next, iterator, done)
+                except Exception:
+                    semaphore.release()
+                    raise
+                if item is done:
+                    semaphore.release()
+                    break
+                tasks.add(asyncio.ensure_future(task(item)))
+                tasks = {t for t in tasks if not t.done()}
+            await asyncio.gather(*tasks)
+
+        def runner():
+            # One extra worker so pulling the next item never starves the tasks
+            with ThreadPoolExecutor(max_workers=self.concurrency + 1) as pool:
+                try:
+                    asyncio.run(run(pool))
+                except asyncio.CancelledError:
+                    return
+                except Exception as e:
+                    results.put((done, e))
+                    return
+            results.put((done, None))
+
+        def notify(callback):
+            try:
+                running["loop"].call_soon_threadsafe(callback)
+            except RuntimeError:
+                # Every task already ran and the loop stopped
+                pass
+
+        thread = threading.Thread(target=runner, name="fetch-engine", daemon=True)
+        thread.start()
+        finished = False
+        try:
+            while True:
+                item, value = results.get()
+                if item is done:
+                    finished = True
+                    thread.join()
+                    if value is not None:
+                        raise value
+                    return
+                notify(running["semaphore"].release)
+                yield item, value
+        finally:
+            if not finished and running:
+                notify(running["task"].cancel)
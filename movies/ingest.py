@@ -0,0 +1,277 @@
+import logging
+import threading
+
+from django.db import transaction
+from django.utils import timezone
+
+from mymdb.db import serialized_write
+
+from .caching import MOVIES, invalidate
+from .metrics import Metrics
+from .models import Genre, Movie
+from .signals import join_genre_titles
+from .stats import StatsDelta, movie_genre_ids, stats_row
+
+logger = logging.getLogger(__name__)
+
+FLAGS = ("on_watchlist", "in_store")
+
+# Fields a complete record has, with the values used when no source has them
+DEFAULTS = {
+    "runtime": -1,
+    "language": "",
+    "genres": [],
+    "poster": "",
+    "imdb_rating": -1,
+    "metascore": -1.0,
+}
+
+
+class GenreIds:
+    """
+    Process-wide map of genre titles to IDs, so writers only query and
+    create the genres they haven't seen yet.
+
+    IDs enter the map once the transaction that read or created them
+    commits, so a rollback can't leave IDs of genres that don't exist.
+    Renaming or deleting a genre clears it, and so does every new writer,
+    as other processes may have changed the genres meanwhile.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = {}
+
+    def resolve(self, titles):
+        """
+        Return the ID of every title, creating the missing genres.
+        """
+        with self.lock:
+            ids = {title: self.ids[title] for title in titles if title in self.ids}
+        missing = titles - ids.keys()
+        if not missing:
+            return ids
+
+        found = dict(Genre.objects.filter(title__in=missing).values_list("title", "pk"))
+        if missing - found.keys():
+            # Another process may create the same genres meanwhile
+            Genre.objects.bulk_create([Genre(title=title) for title in missing - found.keys()], ignore_conflicts=True)
+            found.update(Genre.objects.filter(title__in=missing - found.keys()).values_list("title", "pk"))
+        transaction.on_commit(lambda: self.update(found))
+        return {**ids, **found}
+
+    def update(self, ids):
+        with self.lock:
+            self.ids.update(ids)
+
+    def clear(self):
+        with self.lock:
+            self.ids.clear()
+
+
+genre_ids = GenreIds()
+
+
+def movie_from_imdb(data, **flags):
+    """
+    Normalize an IMDbPY movie into a record the writer understands.
+    """
+    runtime = -1
+    try:
+        runtime = int(data["runtimes"][0])
+    except Exception:
+        pass
+
+    return {
+        "imdb_id": f"tt{data.movieID}",
+        "title": data["title"],
+        "year": data["year"],
+        "runtime": runtime,
+        "language": ", ".join(data.get("languages", [])),
+        "poster": data["cover url"],
+        "imdb_rating": data.get("rating", -1),
+        "metascore": float(data.get("metascore", -1)),
+        "genres": [title.strip() for title in data.get("genres", [])],
+        "on_watchlist": False,
+        "in_store": False,
+        **flags,
+    }
+
+
+def movie_from_omdb(data, **flags):
+    """
+    Normalize an OMDb response into a record the writer understands.
+
+    Fields OMDb doesn't know about ("N/A") are left out of the record.
+    """
+
+    def value(key):
+        v = data.get(key, "N/A")
+        return None if v in ("N/A", "") else v
+
+    record = {
+        "imdb_id": data["imdbID"],
+        "title": data["Title"],
+        "year": int(data["Year"][:4]),
+        **flags,
+    }
+    if value("Runtime"):
+        try:
+            record["runtime"] = int(value("Runtime").split()[0])
+        except ValueError:
+            pass
+    if value("Language"):
+        record["language"] = value("Language")
+    if value("Genre"):
+        record["genres"] = [title.strip() for title in value("Genre").split(",")]
+    if value("Poster"):
+        record["poster"] = value("Poster")
+    if value("Awards"):
+        record["awards"] = value("Awards")
+    if value("imdbRating"):
+        record["imdb_rating"] = float(value("imdbRating"))
+    if value("Metascore"):
+        record["metascore"] = float(value("Metascore"))
+    return record
+
+
+def missing_fields(record):
+    return [key for key in DEFAULTS if key not in record]
+
+
+def complete(record):
+    """
+    Fill the fields no source provided with their defaults.
+    """
+    return {**DEFAULTS, **record}
+
+
+class MovieWriter:
+    """
+    Buffer movie records and write them in batches from a single thread.
+
+    A record is a dict with at least an ``imdb_id``. Full records (with a
+    ``title``) create the movie when it doesn't exist yet; for movies that
+    already exist only the flags set on the record are turned on. Writes
+    are timed as the "db_write" stage of ``metrics`` and ``on_write`` is
+    called with the IMDb IDs of every batch once it is committed. Flag-only
+    records of movies that don't exist (anymore) can't be written; they
+    are logged and ``on_missing`` is called with their IMDb IDs instead.
+    """
+
+    def __init__(self, batch_size=500, metrics=None, on_write=None, on_missing=None):
+        self.batch_size = batch_size
+        self.metrics = metrics or Metrics(interval=0)
+        self.on_write = on_write
+        self.on_missing = on_missing
+        genre_ids.clear()
+        self.pending = {}
+        self.created = 0
+        self.updated = 0
+        self.missing = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+
+    def add(self, record):
+        current = self.pending.setdefault(record["imdb_id"], {})
+        for key, value in record.items():
+            if key in FLAGS:
+                current[key] = current.get(key, False) or value
+            elif key not in current:
+                current[key] = value
+
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        records, self.pending = list(self.pending.values()), {}
+        if not records:
+            return
+
+        with self.metrics.stage("db_write"), serialized_write():
+            missing = self._write(records)
+        logger.debug(f"Wrote a batch of {len(records)} movies")
+        if missing:
+            logger.warning(f"Dropped the flags of {len(missing)} deleted movies: {', '.join(sorted(missing))}")
+            self.missing += len(missing)
+            if self.on_missing:
+                self.on_missing(missing)
+        if self.on_write:
+            self.on_write([record["imdb_id"] for record in records if record["imdb_id"] not in missing])
+
+    def _write(self, records):
+        existing = Movie.objects.in_bulk(
+            [record["imdb_id"] for record in records], field_name="imdb_id"
+        )
+        now = timezone.now()
+        to_create, to_update, genres, old_rows, missing = [], [], {}, {}, set()
+
+        for record in records:
+            movie = existing.get(record["imdb_id"])
+            if movie is not None:
+                changed = False
+                old_rows[movie.pk] = stats_row(movie)
+                for flag in FLAGS:
+                    if record.get(flag) and not getattr(movie, flag):
+                        setattr(movie, flag, True)
+                        changed = True
+                if changed:
+                    movie.updated_at = now
+                    to_update.append(movie)
+            elif "title" in record:
+                fields = {key: value for key, value in record.items() if key != "genres"}
+                fields["genre_titles"] = join_genre_titles(record.get("genres", []))
+                for flag in FLAGS:
+                    fields.setdefault(flag, False)
+                movie = Movie(**fields)
+                to_create.append(movie)
+                genres[movie.pk] = record.get("genres", [])
+            else:
+                missing.add(record["imdb_id"])
+
+        Movie.objects.bulk_create(to_create)
+        Movie.objects.bulk_update(to_update, [*FLAGS, "updated_at"])
+        genre_ids = self.add_genres(genres)
+
+        delta = StatsDelta()
+        for movie in to_create:
+            delta.add(stats_row(movie), {genre_ids[title] for title in genres[movie.pk]})
+        updated_genre_ids = movie_genre_ids(movie.pk for movie in to_update)
+        for movie in to_update:
+            delta.change(old_rows[movie.pk], stats_row(movie), updated_genre_ids[movie.pk])
+        delta.save()
+        # Bulk writes don't send the signals that invalidate the cache
+        if to_create:
+            invalidate()
+        elif to_update:
+            invalidate(MOVIES)
+
+        self.created += len(to_create)
+        self.updated += len(to_update)
+        return missing
+
+    def add_genres(self, movie_genres):
+        """
+        Link movies to genres by title, creating the missing genres, and
+        return the ID of every title.
+        """
+        titles = {title for movie_titles in movie_genres.values() for title in movie_titles}
+        if not titles:
+            return {}
+
+        ids = genre_ids.resolve(titles)
+        through = Movie.genres.through
+        through.objects.bulk_create(
+            [
+                through(movie_id=movie_id, genre_id=ids[title])
+                for movie_id, movie_titles in movie_genres.items()
+                for title in set(movie_titles)
+            ],
+            ignore_conflicts=True,
+        )
+        return ids
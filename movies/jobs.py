@@ -0,0 +1,126 @@
+import threading
+from collections import defaultdict
+
+from django.utils import timezone
+
+from mymdb.db import serialized_write
+
+from .models import ImportItem
+
+State = ImportItem.State
+
+
+class ImportQueue:
+    """
+    Persistent record of the items of an import and how far each one got.
+
+    A fresh import starts with an empty queue. With ``resume`` the items
+    written by an earlier run are skipped, and so are the failed ones
+    unless ``retry_failed`` is set too; with ``retry_failed`` alone only
+    the items that failed are processed. Keys are turned into strings with
+    ``encode`` and changes are saved in batches from the calling thread.
+    """
+
+    def __init__(self, command, resume=False, retry_failed=False, encode=str, batch_size=500):
+        self.command = command
+        self.resume = resume
+        self.retry_failed = retry_failed
+        self.encode = encode
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+        # Items to insert and items to update, by encoded key
+        self.new, self.dirty = {}, {}
+        self.fetched_keys = defaultdict(list)
+        # Keys written by an earlier run and their IMDb ID
+        self.skipped = {}
+
+        if resume or retry_failed:
+            self.items = {item.key: item for item in ImportItem.objects.filter(command=command)}
+        else:
+            with serialized_write():
+                ImportItem.objects.filter(command=command).delete()
+            self.items = {}
+
+    def wanted(self, item):
+        if item is None or item.state in (State.PENDING, State.FETCHED):
+            return self.resume or not self.retry_failed
+        if item.state == State.FAILED:
+            return self.retry_failed
+        return False
+
+    def filter(self, keys):
+        """
+        Queue the keys to process and yield them, leaving out the others.
+        """
+        for key in keys:
+            with self.lock:
+                item = self.items.get(self.encode(key))
+            if item is not None and item.state == State.WRITTEN:
+                self.skipped[key] = item.imdb_id
+            if self.wanted(item):
+                self._update(key, state=State.PENDING)
+                yield key
+
+    def _update(self, key, attempted=False, **fields):
+        encoded = self.encode(key)
+        with self.lock:
+            item = self.items.get(encoded)
+            if item is None:
+                item = self.items[encoded] = self.new[encoded] = ImportItem(command=self.command, key=encoded)
+            elif encoded not in self.new:
+                self.dirty[encoded] = item
+            for name, value in fields.items():
+                setattr(item, name, value)
+            if attempted:
+                item.attempts += 1
+            item.updated_at = timezone.now()
+        return item
+
+    def fetched(self, key, imdb_id):
+        self._update(key, attempted=True, state=State.FETCHED, imdb_id=imdb_id, error="")
+        with self.lock:
+            self.fetched_keys[imdb_id].append(key)
+        self.maybe_flush()
+
+    def failed(self, key, error):
+        self._update(key, attempted=True, state=State.FAILED, error=str(error))
+        self.maybe_flush()
+
+    def written(self, imdb_ids):
+        """
+        Mark the fetched items of these movies as written.
+        """
+        for imdb_id in imdb_ids:
+            with self.lock:
+                keys = self.fetched_keys.pop(imdb_id, [])
+            for key in keys:
+                self._update(key, state=State.WRITTEN)
+        self.maybe_flush()
+
+    def missing(self, imdb_ids):
+        """
+        Mark the fetched items of these movies as failed, the movies were
+        deleted before their flags could be written.
+        """
+        for imdb_id in imdb_ids:
+            with self.lock:
+                keys = self.fetched_keys.pop(imdb_id, [])
+            for key in keys:
+                self._update(key, state=State.FAILED, error=f"{imdb_id} was deleted before it was written")
+        self.maybe_flush()
+
+    def maybe_flush(self):
+        if len(self.new) + len(self.dirty) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            new, self.new = list(self.new.values()), {}
+            dirty, self.dirty = list(self.dirty.values()), {}
+        with serialized_write():
+            ImportItem.objects.bulk_create(new)
+            ImportItem.objects.bulk_update(dirty, ["state", "attempts", "error", "imdb_id", "updated_at"])
+
+    def count(self, state):
+        with self.lock:
+            return sum(1 for item in self.items.values() if item.state == state)
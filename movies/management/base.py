@@ -0,0 +1,145 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from movies.cache import NullCache, ResponseCache, duration
+from movies.fetch import FetchEngine
+from movies.jobs import ImportQueue
+from movies.metrics import Metrics
+from movies.models import ImportItem, RecommendationBuild
+from movies.posters import PosterDownloader
+from movies.providers import PROVIDERS, get_provider
+
+
+class FetchCommand(BaseCommand):
+    """
+    Base for the commands that fetch movie metadata from IMDb or OMDb.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--provider",
+            choices=PROVIDERS,
+            default="auto",
+            help="Where to fetch movie metadata from; auto uses OMDb and falls back to IMDb",
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=32, help="Maximum number of movies fetched at once"
+        )
+        parser.add_argument(
+            "--rps",
+            type=float,
+            default=10.0,
+            help="Maximum requests per second to each upstream host (0 for no limit)",
+        )
+        parser.add_argument(
+            "--progress-every",
+            type=float,
+            default=10.0,
+            metavar="SECONDS",
+            help="How often to log the progress of the import (0 to never)",
+        )
+        parser.add_argument("--metrics-json", metavar="PATH", help="Write the import metrics to PATH as JSON")
+        parser.add_argument(
+            "--metrics-textfile",
+            metavar="PATH",
+            help="Write the import metrics to PATH for the Prometheus node exporter textfile collector",
+        )
+
+    def handle_verbosity(self, v):
+        self.logger = logging.getLogger(self.__module__)
+        level = [logging.FATAL, logging.ERROR, logging.INFO, logging.DEBUG][v]
+        self.logger.setLevel(level)
+        # The command may run several times in a process (call_command, tests)
+        if not self.logger.handlers:
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter())
+            self.logger.addHandler(handler)
+        self.logger.info("Starting...")
+
+    def handle_metrics(self, options):
+        self.metrics = Metrics(interval=options["progress_every"], logger=self.logger)
+
+    def handle_cache(self, options):
+        self.cache = NullCache()
+
+    def handle_engine(self, options):
+        self.engine = FetchEngine(concurrency=options["concurrency"], rps=options["rps"], metrics=self.metrics)
+
+    def handle_provider(self, options):
+        self.provider = get_provider(options["provider"], self.engine, self.cache)
+
+    def update_recommendations(self):
+        if not RecommendationBuild.outdated():
+            return
+        # NumPy is slow to import, runs that changed nothing never load it
+        from movies.recommend import build
+
+        with self.metrics.stage("recommendations"):
+            build()
+
+    def report_metrics(self, options):
+        self.metrics.log_summary()
+        if options["metrics_json"]:
+            self.metrics.write_json(options["metrics_json"])
+        if options["metrics_textfile"]:
+            self.metrics.write_textfile(options["metrics_textfile"], job=self.__module__.rsplit(".", 1)[-1])
+
+
+class ImportCommand(FetchCommand):
+    """
+    Base for the commands that import movies from IMDb.
+    """
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--no-cache", action="store_true", help="Don't read from or write to the metadata cache"
+        )
+        parser.add_argument(
+            "--refresh-older-than",
+            type=duration,
+            metavar="AGE",
+            help='Refetch cached metadata older than AGE (e.g. "12h" or "7d")',
+        )
+        parser.add_argument(
+            "--no-posters", action="store_true", help="Don't download the posters of new movies"
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Continue the last import, skipping the items it already wrote or failed",
+        )
+        parser.add_argument(
+            "--retry-failed",
+            action="store_true",
+            help="Process the items the last import failed on (with --resume, along with the remaining ones)",
+        )
+        super().add_arguments(parser)
+
+    def handle_queue(self, options, encode=str):
+        self.queue = ImportQueue(
+            self.__module__.rsplit(".", 1)[-1],
+            resume=options["resume"],
+            retry_failed=options["retry_failed"],
+            encode=encode,
+        )
+
+    def save_queue(self):
+        self.queue.flush()
+        failed = self.queue.count(ImportItem.State.FAILED)
+        if failed:
+            self.logger.error(f"{failed} items failed, run again with --retry-failed to retry them")
+
+    def handle_cache(self, options):
+        if options["no_cache"]:
+            self.cache = NullCache()
+        else:
+            self.cache = ResponseCache.from_settings(max_age=options["refresh_older_than"])
+        self.metrics.watch_cache(self.cache)
+
+    def handle_posters(self, options):
+        self.posters = None if options["no_posters"] else PosterDownloader(self.engine)
+
+    def save_posters(self):
+        if self.posters:
+            self.logger.info(f"{self.posters.save()} posters downloaded")
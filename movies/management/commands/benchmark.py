@@ -0,0 +1,160 @@
+import csv
+import json
+import os
+import tempfile
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from movies.benchmark import FakeBackend, Timer, peak_rss, summarize, synthetic_movie
+from movies.management.commands import update_store, update_watchlist
+from movies.providers import PROVIDERS
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = "Benchmark the imports and the admin against a fake IMDb/OMDb backend on synthetic libraries"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes",
+            type=int,
+            nargs="+",
+            default=[1000, 10000, 50000],
+            help="Number of titles of each synthetic library",
+        )
+        parser.add_argument(
+            "--latency", type=float, default=0.05, help="Average latency of the fake backend, in seconds"
+        )
+        parser.add_argument(
+            "--error-rate",
+            type=float,
+            default=0.0,
+            help="Share of fake backend calls failing with a retryable error",
+        )
+        parser.add_argument("--provider", choices=PROVIDERS, default="auto")
+        parser.add_argument("--concurrency", type=int, default=32)
+        parser.add_argument(
+            "--rps", type=float, default=0, help="Requests per second to each fake host (0 for no limit)"
+        )
+        parser.add_argument("--requests", type=int, default=20, help="Number of timed requests per admin view")
+        parser.add_argument("--output", "-o", help="Write the JSON results to this file instead of stdout")
+
+    def run_import(self, command, args, items, options):
+        timer = Timer(command.fetch_movie)
+        command.fetch_movie = timer
+        counter = QueryCounter()
+
+        start = time.perf_counter()
+        with connection.execute_wrapper(counter):
+            call_command(
+                command,
+                *args,
+                no_cache=True,
+                no_posters=True,
+                provider=options["provider"],
+                concurrency=options["concurrency"],
+                rps=options["rps"],
+                verbosity=0,
+            )
+        result = summarize(timer.latencies, time.perf_counter() - start, items)
+        result.update(queries=counter.count, fetched=len(timer.latencies), peak_rss=peak_rss())
+        return result
+
+    def run_view(self, client, url, params, samples):
+        latencies, queries = [], []
+        client.get(url, params)  # Warm up the caches
+        start = time.perf_counter()
+        for _ in range(samples):
+            counter = QueryCounter()
+            request_start = time.perf_counter()
+            with connection.execute_wrapper(counter):
+                resp = client.get(url, params)
+            latencies.append(time.perf_counter() - request_start)
+            queries.append(counter.count)
+            if resp.status_code != 200:
+                raise Exception(f"{url} answered {resp.status_code}")
+        result = summarize(latencies, time.perf_counter() - start, samples)
+        result.update(queries=max(queries), peak_rss=peak_rss())
+        return result
+
+    def run_size(self, size, workdir, options):
+        root = os.path.join(workdir, f"store-{size}")
+        os.makedirs(root)
+        for i in range(size):
+            movie = synthetic_movie(i)
+            name = f"{movie['title'].replace(' ', '.')}.{movie['year']}.1080p.BluRay.x264-BENCH.mkv"
+            open(os.path.join(root, name), "wb").close()
+
+        # Half of the watchlist is already in the store, half is new
+        watchlist = os.path.join(workdir, f"watchlist-{size}.csv")
+        with open(watchlist, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["Const", "Title"])
+            for i in range(size // 2, size + size // 2):
+                movie = synthetic_movie(i)
+                writer.writerow([f"tt{movie['id']}", movie["title"]])
+
+        backend = FakeBackend(latency=options["latency"], error_rate=options["error_rate"])
+        result = {"size": size}
+        with backend.installed():
+            result["update_store"] = self.run_import(update_store.Command(), [root], size, options)
+            result["update_watchlist"] = self.run_import(update_watchlist.Command(), [watchlist], size, options)
+        result["backend"] = {"calls": backend.calls, "errors": backend.errors}
+
+        user = get_user_model().objects.create_superuser("benchmark", "benchmark@example.com", "benchmark")
+        client = Client()
+        client.force_login(user)
+        url = reverse("admin:movies_movie_changelist")
+        samples = options["requests"]
+        result["admin_changelist"] = self.run_view(client, url, {}, samples)
+        result["admin_filtered_changelist"] = self.run_view(client, url, {"on_watchlist__exact": "1"}, samples)
+        result["admin_search"] = self.run_view(client, url, {"q": f"Synthetic Movie {size // 3}"}, samples)
+        result["admin_stats"] = self.run_view(client, reverse("admin:movies_movie_stats"), {}, samples)
+        return result
+
+    def handle(self, *args, **options):
+        results = {
+            "options": {
+                key: options[key]
+                for key in ("sizes", "latency", "error_rate", "provider", "concurrency", "rps", "requests")
+            },
+            "runs": [],
+        }
+
+        setup_test_environment()
+        # A private cache, so the benchmark neither reads nor clobbers the server's
+        caches = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "benchmark"}}
+        try:
+            with override_settings(CACHES=caches), tempfile.TemporaryDirectory(prefix="mymdb-benchmark-") as workdir:
+                for size in options["sizes"]:
+                    # A fresh database on disk for every library, like a real deployment
+                    connection.settings_dict["TEST"]["NAME"] = os.path.join(workdir, f"db-{size}.sqlite3")
+                    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+                    try:
+                        results["runs"].append(self.run_size(size, workdir, options))
+                    finally:
+                        connection.creation.destroy_test_db(old_name, verbosity=0)
+        finally:
+            teardown_test_environment()
+
+        output = json.dumps(results, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                f.write(output + "\n")
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from movies import recommend
+
+
+class Command(BaseCommand):
+    help = "Update the watch-next recommendations with the movies that changed since the last build"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--full", action="store_true", help="Recompute the recommendations of every movie")
+
+    def handle(self, *args, **options):
+        if recommend.np is None:
+            raise CommandError("NumPy is required to build the recommendations")
+        count = recommend.build(full=options["full"])
+        self.stdout.write(f"Recommendations of {count} movies rebuilt")
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from movies import snapshot
+
+
+class Command(BaseCommand):
+    help = "Export the movies and genres to a snapshot that import_catalog loads back"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "PATH", help="Where to write the snapshot: a gzipped JSON Lines file, or a directory for Parquet"
+        )
+        parser.add_argument(
+            "--format",
+            choices=snapshot.FORMATS,
+            default="jsonl",
+            help="Snapshot format; Parquet requires pyarrow",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            counts = snapshot.export(options["PATH"], options["format"])
+        except (OSError, RuntimeError) as e:
+            raise CommandError(f"Failed to export the catalog: {e}")
+        self.stdout.write(", ".join(f"{count} {table}" for table, count in counts.items()) + " exported")
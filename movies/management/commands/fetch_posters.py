@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from movies.fetch import FetchEngine
+from movies.models import Movie
+from movies.posters import PosterDownloader
+
+
+class Command(BaseCommand):
+    help = "Download the posters of the movies that have no local copy yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--concurrency", type=int, default=None, help="Maximum number of posters downloaded at once"
+        )
+        parser.add_argument(
+            "--rps", type=float, default=10.0, help="Maximum requests per second (0 for no limit)"
+        )
+
+    def handle(self, *args, **options):
+        downloader = PosterDownloader(FetchEngine(rps=options["rps"]), concurrency=options["concurrency"])
+        for imdb_id, poster in Movie.objects.filter(poster_file="").exclude(poster="").values_list(
+            "imdb_id", "poster"
+        ):
+            downloader.add({"imdb_id": imdb_id, "poster": poster})
+        self.stdout.write(f"{downloader.save()} posters downloaded")
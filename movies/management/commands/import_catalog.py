@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from movies import recommend, snapshot
+
+
+class Command(BaseCommand):
+    help = "Load a snapshot written by export_catalog, keeping the movies and genres that already exist"
+
+    def add_arguments(self, parser):
+        parser.add_argument("PATH", help="The snapshot, a gzipped JSON Lines file or a Parquet directory")
+
+    def handle(self, *args, **options):
+        try:
+            counts = snapshot.load(options["PATH"])
+        except (OSError, RuntimeError, ValueError) as e:
+            raise CommandError(f"Failed to load the snapshot: {e}")
+        self.stdout.write(", ".join(f"{count} {table}" for table, count in counts.items()) + " added")
+        # The library changed wholesale
+        recommend.build(full=True)
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from movies import stats
+from movies.models import GenreStats, YearStats
+
+
+class Command(BaseCommand):
+    help = "Recompute the library statistics from every movie"
+
+    def handle(self, *args, **options):
+        stats.rebuild()
+        self.stdout.write(f"{YearStats.objects.count()} year and {GenreStats.objects.count()} genre groups rebuilt")
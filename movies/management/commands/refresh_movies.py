@@ -0,0 +1,128 @@
+import time
+from datetime import timedelta
+
+from django.utils import timezone
+
+from movies.cache import duration
+from movies.caching import MOVIES, invalidate
+from movies.stats import STATS_FIELDS, StatsDelta, movie_genre_ids, stats_row
+from movies.fetch import RequestBudget
+from movies.management.base import FetchCommand
+from movies.models import Movie
+from movies.providers import RATING_FIELDS
+from mymdb.db import serialized_write
+
+
+class Command(FetchCommand):
+    help = "Refresh the ratings and metascores of the movies that were updated the longest ago"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than",
+            type=duration,
+            default="7d",
+            metavar="AGE",
+            help='Only refresh movies not refreshed for AGE (e.g. "12h" or "7d")',
+        )
+        parser.add_argument("--budget", type=int, default=500, help="Maximum upstream requests per hour")
+        parser.add_argument("--batch-size", type=int, default=20, help="Number of movies refreshed at once")
+        parser.add_argument(
+            "--limit", type=int, help="Maximum number of movies refreshed by a run (the budget by default)"
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep running, refreshing movies as they become stale and the budget allows",
+        )
+        parser.add_argument(
+            "--idle",
+            type=duration,
+            default="15m",
+            metavar="AGE",
+            help="How long to wait when no movie is stale, with --loop",
+        )
+        super().add_arguments(parser)
+
+    def handle_engine(self, options):
+        super().handle_engine(options)
+        # Every upstream request, retries and fallbacks included, waits for the budget
+        self.engine.budget = self.budget
+
+    def stalest(self, older_than, count):
+        return list(
+            Movie.objects.filter(refreshed_at__lt=timezone.now() - timedelta(seconds=older_than))
+            .order_by("refreshed_at")
+            .only("pk", "imdb_id", *STATS_FIELDS, "refreshed_at")[:count]
+        )
+
+    def refresh(self, movies):
+        """
+        Fetch the ratings of the movies and save the ones that changed.
+        """
+        now = timezone.now()
+        changed = []
+        delta = StatsDelta()
+        genre_ids = movie_genre_ids(movie.pk for movie in movies)
+        for movie, future in self.engine.map(lambda movie: self.provider.ratings(movie.imdb_id), movies):
+            try:
+                ratings = future.result()
+            except Exception as e:
+                self.logger.error(f'Failed to refresh "{movie.imdb_id}": {e}')
+                self.metrics.advance(ok=False)
+                continue
+            self.metrics.advance()
+            if any(getattr(movie, field) != value for field, value in ratings.items()):
+                old = stats_row(movie)
+                for field, value in ratings.items():
+                    setattr(movie, field, value)
+                movie.updated_at = now
+                changed.append(movie)
+                delta.change(old, stats_row(movie), genre_ids[movie.pk])
+
+        with self.metrics.stage("db_write"), serialized_write():
+            # Failed movies move to the back of the line too
+            Movie.objects.filter(pk__in=[movie.pk for movie in movies]).update(refreshed_at=now)
+            Movie.objects.bulk_update(changed, [*RATING_FIELDS, "updated_at"])
+            delta.save()
+        if changed:
+            invalidate(MOVIES)
+        return len(changed)
+
+    def handle(self, *args, **options):
+        self.handle_verbosity(options["verbosity"])
+        self.handle_metrics(options)
+        self.handle_cache(options)
+        self.budget = RequestBudget(options["budget"])
+        self.handle_engine(options)
+        self.handle_provider(options)
+
+        batch_size = min(options["batch_size"], options["budget"])
+        remaining = options["budget"] if options["limit"] is None else options["limit"]
+        refreshed, changed = 0, 0
+        # Whether ratings changed since the recommendations were last updated
+        outdated = False
+        try:
+            while options["loop"] or refreshed < remaining:
+                count = batch_size if options["loop"] else min(batch_size, remaining - refreshed)
+                self.budget.wait(count)
+                movies = self.stalest(options["older_than"], count)
+                if not movies:
+                    if not options["loop"]:
+                        break
+                    if outdated:
+                        # Caught up, a good time to update the recommendations
+                        self.update_recommendations()
+                        outdated = False
+                    time.sleep(options["idle"])
+                    continue
+                updated = self.refresh(movies)
+                changed += updated
+                outdated = outdated or updated > 0
+                refreshed += len(movies)
+            if outdated:
+                self.update_recommendations()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.logger.info(f"{refreshed} movies refreshed, {changed} with new ratings")
+            self.report_metrics(options)
@@ -1,102 +1,163 @@
-import logging
+import json
 import os
-import sys
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from functools import partial
 
-from django.core.management.base import BaseCommand
-from imdb import IMDb
+from django.utils import timezone
 
-from movies.models import Genre, Movie
+from movies import stats
+from movies.caching import MOVIES, invalidate
+from movies.ingest import MovieWriter
+from movies.management.base import ImportCommand
+from movies.models import Movie, StoreEntry
+from movies.names import TitleIndex, parse_name
+from movies.scanner import DEFAULT_IGNORE, Scanner
+from mymdb.db import serialized_write
 
 
-class Command(BaseCommand):
+class Command(ImportCommand):
     help = "Update the movie database from a directory of movies"
 
     def add_arguments(self, parser):
-        parser.add_argument("PATH", type=str, help="The path to look for movies")
-
-    def handle_verbosity(self, v):
-        self.logger = logging.getLogger(__name__)
-        level = [logging.FATAL, logging.ERROR, logging.INFO, logging.DEBUG][v]
-        self.logger.setLevel(level)
-        handler = logging.StreamHandler()
-        handler.setFormatter(logging.Formatter())
-        self.logger.addHandler(handler)
-        self.logger.info("Starting...")
-
-    def searchable_name(self, name):
-        return name.replace(".", " ").lower()
-
-    def update_movie(self, data):
-        try:
-            movie = Movie.objects.get(imdb_id=f"tt{data.movieID}")
-            movie.in_store = True
-            movie.save()
-            self.logger.info(f'Marked "{movie.title}" exist in store.')
-            return
-        except Movie.DoesNotExist:
-            pass
-
-        runtime = -1
-        try:
-            runtime = int(data["runtimes"][0])
-        except Exception:
-            pass
-
-        try:
-            movie = Movie.objects.create(
-                imdb_id=f"tt{data.movieID}",
-                title=data["title"],
-                year=data["year"],
-                runtime=runtime,
-                language=", ".join(data.get("languages", [])),
-                poster=data["cover url"],
-                imdb_rating=data.get("rating", -1),
-                metascore=float(data.get("metascore", -1)),
-                on_watchlist=False,
-                in_store=True,
-            )
-            movie.genres.add(
-                *[
-                    Genre.objects.get_or_create(title=title.strip())[0].pk
-                    for title in data.get("genres", [])
-                ]
-            )
-        except Exception as e:
-            self.logger.error(f'Failed to create movie "{id}": {e}')
-            raise e
-
-        self.logger.info(f'Added "{movie.title}" successfully')
-
-    def fetch_movie(self, name):
-        sname = self.searchable_name(name)
-        self.logger.debug(f'Fetching "{sname}"...')
-        try:
-            data = self.imdb.search_movie(sname, results=1)[0]
-            self.imdb.update(data, info=["main", "critic_reviews"])
-        except Exception as e:
-            self.logger.error(f'Failed to fetch "{sname}": {e}')
-            return
-        self.update_movie(data)
-
-    def fetch_movies(self, names):
-        with ThreadPoolExecutor(max_workers=32) as pool:
-            futures = [pool.submit(partial(self.fetch_movie, name)) for name in names]
-
+        parser.add_argument("PATH", type=str, nargs="+", help="The paths to look for movies")
+        parser.add_argument(
+            "--rescan", action="store_true", help="Process every entry, even the unchanged ones"
+        )
+        parser.add_argument(
+            "--max-depth", type=int, default=3, help="How many folder levels to walk below each path"
+        )
+        parser.add_argument(
+            "--ignore",
+            action="append",
+            default=list(DEFAULT_IGNORE),
+            metavar="GLOB",
+            help="Skip files and folders matching GLOB, in addition to the hidden and system ones",
+        )
+        super().add_arguments(parser)
+
+    def fetch_movie(self, key):
+        root, name = key
+        title, year = parse_name(os.path.basename(name))
+        imdb_id = self.titles.match(title, year)
+        if imdb_id:
+            self.logger.debug(f'Matched "{name}" to {imdb_id}')
+            return {"imdb_id": imdb_id, "in_store": True}
+
+        self.logger.debug(f'Fetching "{title}" ({year})...')
+        return {**self.provider.lookup(title, year), "in_store": True}
+
+    def fetch_movies(self, keys):
+        """
+        Fetch and write the movies of the given (root, name) entries.
+
+        Return the IMDb ID each entry resolved to, None for failed ones.
+        Entries an interrupted run already wrote are resolved from the queue.
+        """
+        resolved = {}
         oks, errors = 0, 0
-        for future in as_completed(futures):
-            if future.exception():
-                errors += 1
-            else:
+        with MovieWriter(
+            metrics=self.metrics, on_write=self.queue.written, on_missing=self.queue.missing
+        ) as writer:
+            for key, future in self.engine.map(self.fetch_movie, self.metrics.listing(self.queue.filter(keys))):
+                resolved[key] = None
+                try:
+                    record = future.result()
+                except Exception as e:
+                    self.logger.error(f'Failed to fetch "{key[1]}": {e}')
+                    self.queue.failed(key, e)
+                    self.metrics.advance(ok=False)
+                    errors += 1
+                    continue
                 oks += 1
-
-        self.logger.info(f"{oks} tasks completed successfully out of {len(futures)}")
+                self.queue.fetched(key, record["imdb_id"])
+                self.metrics.advance()
+                writer.add(record)
+                if self.posters:
+                    self.posters.add(record)
+                resolved[key] = record["imdb_id"]
+
+        self.logger.info(f"{writer.created} movies added, {writer.updated} marked in store")
+        self.logger.info(f"{oks} tasks completed successfully out of {len(resolved)}")
         if errors > 0:
             self.logger.error(f"{errors} tasks failed to complete successfully")
+        if self.queue.skipped:
+            self.logger.info(f"{len(self.queue.skipped)} entries already written by the last run")
+        return {**self.queue.skipped, **resolved}
+
+    def changed_entries(self, scanner, rescan):
+        """
+        Yield the (root, name) of the new or changed entries while scanning,
+        and of the ones whose movie is no longer in the database.
+        """
+        for root, name, signature in scanner:
+            key = (root, name)
+            self.signatures[key] = signature
+            entry = self.index.get(key)
+            if rescan or entry is None or entry.imdb_id not in self.existing or entry.signature != signature:
+                yield key
+
+    def update_index(self, resolved):
+        to_create, to_update = [], []
+        for key, imdb_id in resolved.items():
+            entry = self.index.get(key)
+            if entry is None:
+                entry = StoreEntry(root=key[0], name=key[1])
+                to_create.append(entry)
+            else:
+                entry.updated_at = timezone.now()
+                to_update.append(entry)
+            entry.inode, entry.mtime, entry.size = self.signatures[key]
+            entry.imdb_id = imdb_id
+
+        with self.metrics.stage("db_write"), serialized_write():
+            StoreEntry.objects.bulk_create(to_create)
+            StoreEntry.objects.bulk_update(to_update, ["inode", "mtime", "size", "imdb_id", "updated_at"])
+
+    def remove_vanished(self, vanished):
+        imdb_ids = {entry.imdb_id for entry in vanished if entry.imdb_id}
+        with self.metrics.stage("db_write"), serialized_write():
+            StoreEntry.objects.filter(pk__in=[entry.pk for entry in vanished]).delete()
+
+            remaining = StoreEntry.objects.filter(imdb_id__in=imdb_ids).values_list("imdb_id", flat=True)
+            removed = stats.update(
+                Movie.objects.filter(imdb_id__in=imdb_ids - set(remaining), in_store=True),
+                in_store=False,
+                updated_at=timezone.now(),
+            )
+        if removed:
+            invalidate(MOVIES)
+        self.logger.info(f"{removed} movies are no longer in store")
 
     def handle(self, *args, **options):
         self.handle_verbosity(options["verbosity"])
-
-        self.imdb = IMDb()
-        self.fetch_movies(os.listdir(options["PATH"]))
+        self.handle_metrics(options)
+        self.handle_queue(options, encode=json.dumps)
+        self.handle_cache(options)
+        self.handle_engine(options)
+        self.handle_provider(options)
+        self.handle_posters(options)
+
+        roots = [os.path.abspath(path) for path in options["PATH"]]
+        self.index = {(entry.root, entry.name): entry for entry in StoreEntry.objects.filter(root__in=roots)}
+        self.existing = set(Movie.objects.values_list("imdb_id", flat=True))
+        self.signatures = {}
+        self.titles = TitleIndex.from_db()
+
+        scanner = Scanner(roots, max_depth=options["max_depth"], ignore=options["ignore"])
+        try:
+            resolved = self.fetch_movies(self.changed_entries(scanner, options["rescan"]))
+        finally:
+            self.save_queue()
+            self.save_posters()
+        self.update_index(resolved)
+
+        # Entries of a root that couldn't be walked completely may still be there
+        vanished = [
+            entry
+            for key, entry in self.index.items()
+            if key not in self.signatures and entry.root not in scanner.failed
+        ]
+        self.logger.info(
+            f"{len(self.signatures)} entries found, {len(resolved)} new or changed, {len(vanished)} vanished"
+        )
+        self.remove_vanished(vanished)
+        self.update_recommendations()
+        self.report_metrics(options)
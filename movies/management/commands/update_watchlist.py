@@ -1,128 +1,113 @@
-import json
-import logging
-import re
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from functools import partial
+from django.core.management.base import CommandError
+from django.utils import timezone
 
-import requests
-from django.core.management.base import BaseCommand
-from imdb import IMDb
+from movies import stats
+from movies.caching import MOVIES, invalidate
+from movies.ingest import MovieWriter
+from movies.management.base import ImportCommand
+from movies.models import Movie
+from movies.watchlist import iter_ids
+from mymdb.db import serialized_write
 
-from movies.models import Genre, Movie
 
-
-class Command(BaseCommand):
-    help = "Update the movie database from an IMDB watchlist URL"
+class Command(ImportCommand):
+    help = "Update the movie database from IMDB watchlist URLs or exported watchlist files"
 
     def add_arguments(self, parser):
-        parser.add_argument("URL", type=str, help="The URL to look for movies")
-
-    def handle_verbosity(self, v):
-        self.logger = logging.getLogger(__name__)
-        level = [logging.FATAL, logging.ERROR, logging.INFO, logging.DEBUG][v]
-        self.logger.setLevel(level)
-        handler = logging.StreamHandler()
-        handler.setFormatter(logging.Formatter())
-        self.logger.addHandler(handler)
-        self.logger.info("Starting...")
-
-    def fetch_url(self, url):
-        self.logger.info(f'Fetching data from "{url}..."')
-        resp = requests.get(url)
-        self.logger.info(f'GET "{url}" status code: {resp.status_code}')
-        self.logger.debug(f"response body: {resp.text}")
-        if not resp.ok:
-            self.logger.fatal(f'Failed to fetch data from "{url}": {resp.status_code}')
-            return exit(1)
-        return resp.text
-
-    def extract_movies_id(self, data):
-        self.logger.info(f"Extracting movies...")
-        jdata = json.loads(re.search(r"\((?P<data>\{.*\})\)", data).groupdict()["data"])
-
-        self.logger.info(f'Found {len(jdata["list"]["items"])} titles')
-        return list(map(lambda movie: movie["const"], jdata["list"]["items"]))
+        parser.add_argument(
+            "SOURCE",
+            type=str,
+            nargs="+",
+            help='The URLs or CSV/JSON files to look for movies; a "{page}" in a URL is paginated',
+        )
+        super().add_arguments(parser)
+
+    def reconcile(self, ids):
+        """
+        Diff the watchlist against the on_watchlist state of the database.
+
+        Yield the IDs that need to be fetched and collect the ones only
+        missing the flag in ``self.to_flag``.
+        """
+        self.seen, self.to_flag = set(), set()
+        for id in ids:
+            if id in self.seen:
+                continue
+            self.seen.add(id)
+            if id not in self.state:
+                yield id
+            elif not self.state[id]:
+                self.to_flag.add(id)
+        self.logger.info(f"Found {len(self.seen)} titles")
+
+    def apply_flags(self):
+        to_unflag = [id for id, flagged in self.state.items() if flagged and id not in self.seen]
+        now = timezone.now()
+        with self.metrics.stage("db_write"), serialized_write():
+            flagged = stats.update(Movie.objects.filter(imdb_id__in=self.to_flag), on_watchlist=True, updated_at=now)
+            unflagged = stats.update(Movie.objects.filter(imdb_id__in=to_unflag), on_watchlist=False, updated_at=now)
+        if flagged or unflagged:
+            invalidate(MOVIES)
+        self.logger.info(f"{flagged} movies marked on watchlist, {unflagged} removed from watchlist")
 
     def fetch_movie(self, id):
         self.logger.info(f"Fetching movie {id}...")
-        try:
-            movie = Movie.objects.get(imdb_id=id)
-            movie.on_watchlist = True
-            movie.save()
-            self.logger.info(f'Marked "{movie.title}" on watchlist')
-            return
-        except Movie.DoesNotExist:
-            pass
-
-        try:
-            data = self.imdb.get_movie(id[2:], info=["main", "critic_reviews"])
-            if data["kind"] != "movie":
-                raise Exception(f'{data["title"]} is not a movie.')
-        except Exception as e:
-            self.logger.error(f'Failed to fetch "{id}": {e}')
-            return
-
-        runtime = -1
-        try:
-            runtime = int(data["runtimes"][0])
-        except Exception:
-            pass
-
-        try:
-            movie = Movie.objects.create(
-                imdb_id=id,
-                title=data["title"],
-                year=data["year"],
-                runtime=runtime,
-                language=", ".join(data.get("languages", [])),
-                poster=data["cover url"],
-                imdb_rating=data.get("rating", -1),
-                metascore=float(data.get("metascore", -1)),
-                on_watchlist=True,
-                in_store=False,
-            )
-            movie.genres.add(
-                *[
-                    Genre.objects.get_or_create(title=title.strip())[0].pk
-                    for title in data["genres"]
-                ]
-            )
-        except Exception as e:
-            self.logger.error(f'Failed to create movie "{id}": {e}')
-            raise e
-
-        self.logger.info(f'Added "{movie.title}" successfully')
+        return {**self.provider.get(id), "on_watchlist": True}
 
     def fetch_movies(self, ids):
         self.logger.info("Fetching data for each movie id")
-        already_exists = Movie.objects.filter(imdb_id__in=ids, on_watchlist=True)
-        self.logger.info(f"{already_exists.count()} already exists.")
-        nonexistents = filter(
-            lambda i: i not in already_exists.values_list("imdb_id", flat=True), ids
-        )
-
-        with ThreadPoolExecutor(max_workers=32) as pool:
-            futures = [
-                pool.submit(partial(self.fetch_movie, id)) for id in nonexistents
-            ]
-
-        oks, errors = 0, 0
-        for future in as_completed(futures):
-            if future.exception():
-                errors += 1
-            else:
-                oks += 1
-
-        self.logger.info(f"{oks} tasks completed successfully out of {len(futures)}")
+        self.state = dict(Movie.objects.values_list("imdb_id", "on_watchlist"))
+
+        total, oks, errors = 0, 0, 0
+        failure = None
+        with MovieWriter(
+            metrics=self.metrics, on_write=self.queue.written, on_missing=self.queue.missing
+        ) as writer:
+            try:
+                items = self.metrics.listing(self.queue.filter(self.reconcile(ids)))
+                for id, future in self.engine.map(self.fetch_movie, items):
+                    total += 1
+                    try:
+                        record = future.result()
+                    except Exception as e:
+                        self.logger.error(f'Failed to fetch "{id}": {e}')
+                        self.queue.failed(id, e)
+                        self.metrics.advance(ok=False)
+                        errors += 1
+                        continue
+                    oks += 1
+                    self.queue.fetched(id, record["imdb_id"])
+                    self.metrics.advance()
+                    writer.add(record)
+                    if self.posters:
+                        self.posters.add(record)
+            except Exception as e:
+                # Keep what was fetched before the watchlist couldn't be read
+                failure = e
+
+        self.logger.info(f"{writer.created} movies added out of {total} new titles")
+        self.logger.info(f"{oks} tasks completed successfully out of {total}")
         if errors > 0:
             self.logger.error(f"{errors} tasks failed to complete successfully")
+        if failure is not None:
+            raise CommandError(f"Failed to read the watchlist: {failure}")
+        # Only a completely read watchlist tells which movies left it
+        self.apply_flags()
 
     def handle(self, *args, **options):
         self.handle_verbosity(options["verbosity"])
+        self.handle_metrics(options)
+        self.handle_queue(options)
+        self.handle_cache(options)
+        self.handle_engine(options)
+        self.handle_provider(options)
+        self.handle_posters(options)
 
-        self.imdb = IMDb()
-
-        result = self.fetch_url(options["URL"])
-        ids = self.extract_movies_id(result)
-        self.fetch_movies(ids)
+        try:
+            self.fetch_movies(iter_ids(self.engine, options["SOURCE"]))
+            self.update_recommendations()
+        finally:
+            self.save_queue()
+            self.save_posters()
+            self.report_metrics(options)
         self.logger.info("Updated watchlist sucessfully")
@@ -0,0 +1,241 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds, in seconds, of the upstream latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m{seconds % 60:02d}s"
+    return f"{seconds // 3600}h{seconds % 3600 // 60:02d}m"
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def quantile(self, q):
+        """
+        Estimate a quantile as the upper bound of the bucket it falls in.
+        """
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if count and seen >= rank:
+                return bound
+        return None
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "buckets": {str(bound): count for bound, count in zip(self.buckets, self.counts)},
+        }
+
+
+class Metrics:
+    """
+    Thread-safe collector of where the time of an import goes.
+
+    It keeps the total time spent in each stage (listing, search, detail,
+    db_write...), a latency histogram and retry count of every upstream
+    host, and the progress of the import, which is logged every
+    ``interval`` seconds with the throughput and, once the listing is
+    complete, the ETA.
+    """
+
+    def __init__(self, interval=10.0, logger=logger):
+        self.interval = interval
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.started_at = time.monotonic()
+        self.logged_at = self.started_at
+        self.stages = defaultdict(lambda: [0, 0.0])
+        self.upstreams = defaultdict(Histogram)
+        self.retries = defaultdict(int)
+        self.shared = 0
+        self.caches = []
+        self.listed = 0
+        self.listing_done = False
+        self.done = 0
+        self.failed = 0
+
+    @contextmanager
+    def stage(self, name):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.monotonic() - start)
+
+    def add_time(self, name, seconds):
+        with self.lock:
+            stage = self.stages[name]
+            stage[0] += 1
+            stage[1] += seconds
+
+    def observe_upstream(self, host, seconds):
+        with self.lock:
+            self.upstreams[host].observe(seconds)
+
+    def retried(self, host):
+        with self.lock:
+            self.retries[host] += 1
+
+    def coalesced(self):
+        """
+        Count a fetch answered by another one for the same title.
+        """
+        with self.lock:
+            self.shared += 1
+
+    def watch_cache(self, cache):
+        self.caches.append(cache)
+
+    def listing(self, items):
+        """
+        Iterate over items, timing the listing stage and counting them.
+        """
+        items = iter(items)
+        while True:
+            start = time.monotonic()
+            item = next(items, StopIteration)
+            self.add_time("listing", time.monotonic() - start)
+            if item is StopIteration:
+                break
+            with self.lock:
+                self.listed += 1
+            yield item
+        self.listing_done = True
+
+    def advance(self, ok=True):
+        with self.lock:
+            self.done += 1
+            if not ok:
+                self.failed += 1
+        if self.interval and time.monotonic() - self.logged_at >= self.interval:
+            self.log_progress()
+
+    def log_progress(self):
+        now = time.monotonic()
+        self.logged_at = now
+        elapsed = now - self.started_at
+        rate = self.done / elapsed if elapsed else 0
+        total = str(self.listed) if self.listing_done else f"{self.listed}+"
+        message = f"{self.done}/{total} done, {self.failed} failed, {rate:.1f}/s"
+        if self.listing_done and rate:
+            message += f", ETA {format_duration((self.listed - self.done) / rate)}"
+        self.logger.info(message)
+
+    def cache_stats(self):
+        hits = sum(getattr(cache, "hits", 0) for cache in self.caches)
+        misses = sum(getattr(cache, "misses", 0) for cache in self.caches)
+        return {"hits": hits, "misses": misses, "ratio": hits / (hits + misses) if hits + misses else None}
+
+    def as_dict(self):
+        elapsed = time.monotonic() - self.started_at
+        with self.lock:
+            return {
+                "elapsed": elapsed,
+                "listed": self.listed,
+                "done": self.done,
+                "failed": self.failed,
+                "throughput": self.done / elapsed if elapsed else None,
+                "stages": {
+                    name: {"count": count, "seconds": seconds} for name, (count, seconds) in self.stages.items()
+                },
+                "upstreams": {
+                    host: {**histogram.as_dict(), "retries": self.retries[host]}
+                    for host, histogram in self.upstreams.items()
+                },
+                "shared": self.shared,
+                "cache": self.cache_stats(),
+            }
+
+    def log_summary(self):
+        data = self.as_dict()
+        self.logger.info(
+            f"{data['done']} titles in {format_duration(data['elapsed'])} ({data['throughput'] or 0:.1f}/s)"
+        )
+        for name, stage in sorted(data["stages"].items(), key=lambda item: -item[1]["seconds"]):
+            self.logger.info(f"  {name}: {stage['seconds']:.1f}s over {stage['count']} calls")
+        for host, upstream in data["upstreams"].items():
+            self.logger.info(
+                f"  {host}: {upstream['count']} requests, p50 <= {upstream['p50']}s, "
+                f"p95 <= {upstream['p95']}s, {upstream['retries']} retries"
+            )
+        if data["shared"]:
+            self.logger.info(f"  {data['shared']} fetches shared with a concurrent or earlier one")
+        if data["cache"]["ratio"] is not None:
+            self.logger.info(f"  cache: {data['cache']['ratio']:.0%} hits")
+
+    def write_json(self, path):
+        _write_atomic(path, json.dumps(self.as_dict(), indent=2) + "\n")
+
+    def write_textfile(self, path, job):
+        """
+        Write the metrics in the Prometheus text format, for the node
+        exporter textfile collector.
+        """
+        data = self.as_dict()
+        labels = f'job="{job}"'
+        lines = [
+            "# TYPE mymdb_import_duration_seconds gauge",
+            f"mymdb_import_duration_seconds{{{labels}}} {data['elapsed']}",
+            "# TYPE mymdb_import_titles gauge",
+            f'mymdb_import_titles{{{labels},status="done"}} {data["done"]}',
+            f'mymdb_import_titles{{{labels},status="failed"}} {data["failed"]}',
+            "# TYPE mymdb_import_stage_seconds gauge",
+        ]
+        for name, stage in data["stages"].items():
+            lines.append(f'mymdb_import_stage_seconds{{{labels},stage="{name}"}} {stage["seconds"]}')
+        lines.append("# TYPE mymdb_upstream_request_seconds histogram")
+        for host, upstream in data["upstreams"].items():
+            cumulative = 0
+            for bound, count in upstream["buckets"].items():
+                cumulative += count
+                le = "+Inf" if bound == "inf" else bound
+                lines.append(f'mymdb_upstream_request_seconds_bucket{{{labels},host="{host}",le="{le}"}} {cumulative}')
+            lines.append(f'mymdb_upstream_request_seconds_sum{{{labels},host="{host}"}} {upstream["sum"]}')
+            lines.append(f'mymdb_upstream_request_seconds_count{{{labels},host="{host}"}} {upstream["count"]}')
+        lines.append("# TYPE mymdb_upstream_retries gauge")
+        for host, upstream in data["upstreams"].items():
+            lines.append(f'mymdb_upstream_retries{{{labels},host="{host}"}} {upstream["retries"]}')
+        lines.append("# TYPE mymdb_import_shared_fetches gauge")
+        lines.append(f"mymdb_import_shared_fetches{{{labels}}} {data['shared']}")
+        lines.append("# TYPE mymdb_cache_requests gauge")
+        lines.append(f'mymdb_cache_requests{{{labels},result="hit"}} {data["cache"]["hits"]}')
+        lines.append(f'mymdb_cache_requests{{{labels},result="miss"}} {data["cache"]["misses"]}')
+        _write_atomic(path, "\n".join(lines) + "\n")
+
+
+def _write_atomic(path, content):
+    # The textfile collector may read the file at any time
+    tmp = f"{path}.tmp{os.getpid()}"
+    with open(tmp, "w") as f:
+        f.write(content)
+    os.replace(tmp, path)
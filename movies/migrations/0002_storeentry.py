@@ -0,0 +1,31 @@
+# Generated by Django 4.0.2 on 2026-10-18 19:34
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoreEntry',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False, verbose_name='id')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='created at')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='updated at')),
+                ('root', models.CharField(max_length=1024, verbose_name='Root')),
+                ('name', models.CharField(max_length=1024, verbose_name='Name')),
+                ('inode', models.BigIntegerField(verbose_name='Inode')),
+                ('mtime', models.FloatField(verbose_name='Modified at')),
+                ('size', models.BigIntegerField(verbose_name='Size')),
+                ('imdb_id', models.CharField(db_index=True, max_length=150, null=True, verbose_name='IMDB ID')),
+            ],
+            options={
+                'unique_together': {('root', 'name')},
+            },
+        ),
+    ]
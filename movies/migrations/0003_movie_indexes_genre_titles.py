@@ -0,0 +1,45 @@
+# Generated by Django 4.0.2 on 2026-10-18 19:37
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def fill_genre_titles(apps, schema_editor):
+    Movie = apps.get_model("movies", "Movie")
+    titles = defaultdict(list)
+    for movie_id, title in Movie.genres.through.objects.values_list("movie_id", "genre__title"):
+        titles[movie_id].append(title)
+
+    movies = list(Movie.objects.only("pk"))
+    for movie in movies:
+        movie.genre_titles = ", ".join(sorted(set(titles[movie.pk])))
+    Movie.objects.bulk_update(movies, ["genre_titles"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0002_storeentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='genre_titles',
+            field=models.CharField(blank=True, default='', editable=False, max_length=1024, verbose_name='Genres'),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['-imdb_rating', '-metascore'], name='movie_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['on_watchlist', '-imdb_rating', '-metascore'], name='movie_watchlist_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['in_store', '-imdb_rating', '-metascore'], name='movie_store_rating_idx'),
+        ),
+        migrations.RunPython(fill_genre_titles, migrations.RunPython.noop),
+    ]
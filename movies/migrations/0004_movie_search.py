@@ -0,0 +1,50 @@
+from django.db import migrations
+
+# Full-text index over movies_movie kept up to date by triggers, so bulk
+# inserts and updates are indexed too. FTS5 rows need an integer rowid;
+# movies_movie_fts_keys assigns one to every movie ID, so the index doesn't
+# depend on the rowids of movies_movie, which a VACUUM or a table rebuild
+# can renumber.
+FIELDS = "title, genre_titles, language, awards"
+
+# Rowid of the index row of a movie
+ROWID = "(SELECT rowid FROM movies_movie_fts_keys WHERE movie_id = {}.id)"
+
+CREATE = [
+    "CREATE TABLE movies_movie_fts_keys (rowid INTEGER PRIMARY KEY, movie_id char(32) NOT NULL UNIQUE)",
+    "CREATE VIRTUAL TABLE movies_movie_fts USING fts5("
+    f"movie_id UNINDEXED, {FIELDS}, tokenize = 'trigram')",
+    "CREATE TRIGGER movies_movie_fts_insert AFTER INSERT ON movies_movie BEGIN "
+    "INSERT INTO movies_movie_fts_keys (movie_id) VALUES (new.id); "
+    f"INSERT INTO movies_movie_fts (rowid, movie_id, {FIELDS}) "
+    f"VALUES ({ROWID.format('new')}, new.id, new.title, new.genre_titles, new.language, new.awards); END",
+    "CREATE TRIGGER movies_movie_fts_delete AFTER DELETE ON movies_movie BEGIN "
+    f"DELETE FROM movies_movie_fts WHERE rowid = {ROWID.format('old')}; "
+    "DELETE FROM movies_movie_fts_keys WHERE movie_id = old.id; END",
+    f"CREATE TRIGGER movies_movie_fts_update AFTER UPDATE OF {FIELDS} ON movies_movie BEGIN "
+    "UPDATE movies_movie_fts SET title = new.title, genre_titles = new.genre_titles, "
+    f"language = new.language, awards = new.awards WHERE rowid = {ROWID.format('new')}; END",
+    "INSERT INTO movies_movie_fts_keys (movie_id) SELECT id FROM movies_movie",
+    f"INSERT INTO movies_movie_fts (rowid, movie_id, {FIELDS}) "
+    "SELECT keys.rowid, movie.id, movie.title, movie.genre_titles, movie.language, movie.awards "
+    "FROM movies_movie movie JOIN movies_movie_fts_keys keys ON keys.movie_id = movie.id",
+]
+
+DROP = [
+    "DROP TABLE movies_movie_fts_keys",
+    "DROP TABLE movies_movie_fts",
+    "DROP TRIGGER movies_movie_fts_insert",
+    "DROP TRIGGER movies_movie_fts_delete",
+    "DROP TRIGGER movies_movie_fts_update",
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0003_movie_indexes_genre_titles'),
+    ]
+
+    operations = [
+        migrations.RunSQL(CREATE, list(reversed(DROP))),
+    ]
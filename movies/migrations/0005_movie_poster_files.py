@@ -0,0 +1,48 @@
+# Generated by Django 4.0.2 on 2026-10-18 19:42
+
+from django.db import migrations, models
+
+# Adding the columns rebuilds movies_movie on SQLite, which drops the
+# search triggers of 0004_movie_search; they are created again here.
+FIELDS = "title, genre_titles, language, awards"
+
+ROWID = "(SELECT rowid FROM movies_movie_fts_keys WHERE movie_id = {}.id)"
+
+TRIGGERS = [
+    "DROP TRIGGER IF EXISTS movies_movie_fts_insert",
+    "DROP TRIGGER IF EXISTS movies_movie_fts_delete",
+    "DROP TRIGGER IF EXISTS movies_movie_fts_update",
+    "CREATE TRIGGER movies_movie_fts_insert AFTER INSERT ON movies_movie BEGIN "
+    "INSERT INTO movies_movie_fts_keys (movie_id) VALUES (new.id); "
+    f"INSERT INTO movies_movie_fts (rowid, movie_id, {FIELDS}) "
+    f"VALUES ({ROWID.format('new')}, new.id, new.title, new.genre_titles, new.language, new.awards); END",
+    "CREATE TRIGGER movies_movie_fts_delete AFTER DELETE ON movies_movie BEGIN "
+    f"DELETE FROM movies_movie_fts WHERE rowid = {ROWID.format('old')}; "
+    "DELETE FROM movies_movie_fts_keys WHERE movie_id = old.id; END",
+    f"CREATE TRIGGER movies_movie_fts_update AFTER UPDATE OF {FIELDS} ON movies_movie BEGIN "
+    "UPDATE movies_movie_fts SET title = new.title, genre_titles = new.genre_titles, "
+    f"language = new.language, awards = new.awards WHERE rowid = {ROWID.format('new')}; END",
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0004_movie_search'),
+    ]
+
+    operations = [
+        # Runs last when unapplying
+        migrations.RunSQL(migrations.RunSQL.noop, TRIGGERS),
+        migrations.AddField(
+            model_name='movie',
+            name='poster_file',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255, verbose_name='Poster file'),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='poster_thumbnail',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255, verbose_name='Poster thumbnail'),
+        ),
+        migrations.RunSQL(TRIGGERS, migrations.RunSQL.noop),
+    ]
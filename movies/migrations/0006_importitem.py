@@ -0,0 +1,31 @@
+# Generated by Django 4.0.2 on 2026-10-18 19:48
+
+from django.db import migrations, models
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0005_movie_poster_files'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportItem',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False, verbose_name='id')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='created at')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='updated at')),
+                ('command', models.CharField(max_length=150, verbose_name='Command')),
+                ('key', models.CharField(max_length=2048, verbose_name='Key')),
+                ('state', models.CharField(choices=[('pending', 'Pending'), ('fetched', 'Fetched'), ('written', 'Written'), ('failed', 'Failed')], default='pending', max_length=16, verbose_name='State')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Attempts')),
+                ('error', models.TextField(blank=True, default='', verbose_name='Last error')),
+                ('imdb_id', models.CharField(max_length=150, null=True, verbose_name='IMDB ID')),
+            ],
+            options={
+                'unique_together': {('command', 'key')},
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.0.2 on 2026-10-18 19:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0006_importitem'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['updated_at'], name='movie_updated_idx'),
+        ),
+    ]
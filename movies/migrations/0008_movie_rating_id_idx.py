@@ -0,0 +1,17 @@
+# Generated by Django 4.0.2 on 2026-10-18 19:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0007_movie_updated_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['-imdb_rating', '-id'], name='movie_rating_id_idx'),
+        ),
+    ]
@@ -0,0 +1,99 @@
+# Generated by Django 4.0.2 on 2026-10-18 20:04
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+import django.db.models.deletion
+import uuid
+
+MEASURES = ("movies", "runtime_sum", "runtime_count", "rating_sum", "rating_count", "metascore_sum", "metascore_count")
+
+
+def aggregates(prefix=""):
+    # Imports store -1 for the values no source has
+    runtime, rating, metascore = f"{prefix}runtime", f"{prefix}imdb_rating", f"{prefix}metascore"
+    return {
+        "movies": Count("pk"),
+        "runtime_sum": Sum(runtime, filter=Q(**{f"{runtime}__gte": 0})),
+        "runtime_count": Count("pk", filter=Q(**{f"{runtime}__gte": 0})),
+        "rating_sum": Sum(rating, filter=Q(**{f"{rating}__gte": 0})),
+        "rating_count": Count("pk", filter=Q(**{f"{rating}__gte": 0})),
+        "metascore_sum": Sum(metascore, filter=Q(**{f"{metascore}__gte": 0})),
+        "metascore_count": Count("pk", filter=Q(**{f"{metascore}__gte": 0})),
+    }
+
+
+def rebuild_stats(apps, schema_editor):
+    Movie = apps.get_model("movies", "Movie")
+    YearStats = apps.get_model("movies", "YearStats")
+    GenreStats = apps.get_model("movies", "GenreStats")
+    years = Movie.objects.values("year", "on_watchlist", "in_store").annotate(**aggregates()).order_by()
+    genres = (
+        Movie.genres.through.objects.values("genre_id", "movie__on_watchlist", "movie__in_store")
+        .annotate(**aggregates("movie__"))
+        .order_by()
+    )
+    YearStats.objects.bulk_create([YearStats(**{**row, **{m: row[m] or 0 for m in MEASURES}}) for row in years])
+    GenreStats.objects.bulk_create(
+        [
+            GenreStats(
+                genre_id=row["genre_id"],
+                on_watchlist=row["movie__on_watchlist"],
+                in_store=row["movie__in_store"],
+                **{m: row[m] or 0 for m in MEASURES},
+            )
+            for row in genres
+        ]
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0009_recommendations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='YearStats',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False, verbose_name='id')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='created at')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='updated at')),
+                ('on_watchlist', models.BooleanField(verbose_name='On Watchlist')),
+                ('in_store', models.BooleanField(verbose_name='In Store')),
+                ('movies', models.IntegerField(default=0, verbose_name='Movies')),
+                ('runtime_sum', models.BigIntegerField(default=0, verbose_name='Runtime sum (min)')),
+                ('runtime_count', models.IntegerField(default=0, verbose_name='Runtime count')),
+                ('rating_sum', models.FloatField(default=0, verbose_name='IMDB Rating sum')),
+                ('rating_count', models.IntegerField(default=0, verbose_name='IMDB Rating count')),
+                ('metascore_sum', models.FloatField(default=0, verbose_name='Metascore sum')),
+                ('metascore_count', models.IntegerField(default=0, verbose_name='Metascore count')),
+                ('year', models.IntegerField(verbose_name='Year')),
+            ],
+            options={
+                'unique_together': {('year', 'on_watchlist', 'in_store')},
+            },
+        ),
+        migrations.CreateModel(
+            name='GenreStats',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, primary_key=True, serialize=False, verbose_name='id')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='created at')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='updated at')),
+                ('on_watchlist', models.BooleanField(verbose_name='On Watchlist')),
+                ('in_store', models.BooleanField(verbose_name='In Store')),
+                ('movies', models.IntegerField(default=0, verbose_name='Movies')),
+                ('runtime_sum', models.BigIntegerField(default=0, verbose_name='Runtime sum (min)')),
+                ('runtime_count', models.IntegerField(default=0, verbose_name='Runtime count')),
+                ('rating_sum', models.FloatField(default=0, verbose_name='IMDB Rating sum')),
+                ('rating_count', models.IntegerField(default=0, verbose_name='IMDB Rating count')),
+                ('metascore_sum', models.FloatField(default=0, verbose_name='Metascore sum')),
+                ('metascore_count', models.IntegerField(default=0, verbose_name='Metascore count')),
+                ('genre', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='movies.genre')),
+            ],
+            options={
+                'unique_together': {('genre', 'on_watchlist', 'in_store')},
+            },
+        ),
+        migrations.RunPython(rebuild_stats, migrations.RunPython.noop),
+    ]
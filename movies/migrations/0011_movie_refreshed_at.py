@@ -0,0 +1,50 @@
+# Generated by Django 4.0.2 on 2026-10-18 20:37
+
+from django.db import migrations, models
+import django.utils.timezone
+
+# Adding the column rebuilds movies_movie on SQLite, which drops the search
+# triggers of 0004_movie_search; they are created again here.
+FIELDS = "title, genre_titles, language, awards"
+
+ROWID = "(SELECT rowid FROM movies_movie_fts_keys WHERE movie_id = {}.id)"
+
+TRIGGERS = [
+    "DROP TRIGGER IF EXISTS movies_movie_fts_insert",
+    "DROP TRIGGER IF EXISTS movies_movie_fts_delete",
+    "DROP TRIGGER IF EXISTS movies_movie_fts_update",
+    "CREATE TRIGGER movies_movie_fts_insert AFTER INSERT ON movies_movie BEGIN "
+    "INSERT INTO movies_movie_fts_keys (movie_id) VALUES (new.id); "
+    f"INSERT INTO movies_movie_fts (rowid, movie_id, {FIELDS}) "
+    f"VALUES ({ROWID.format('new')}, new.id, new.title, new.genre_titles, new.language, new.awards); END",
+    "CREATE TRIGGER movies_movie_fts_delete AFTER DELETE ON movies_movie BEGIN "
+    f"DELETE FROM movies_movie_fts WHERE rowid = {ROWID.format('old')}; "
+    "DELETE FROM movies_movie_fts_keys WHERE movie_id = old.id; END",
+    f"CREATE TRIGGER movies_movie_fts_update AFTER UPDATE OF {FIELDS} ON movies_movie BEGIN "
+    "UPDATE movies_movie_fts SET title = new.title, genre_titles = new.genre_titles, "
+    f"language = new.language, awards = new.awards WHERE rowid = {ROWID.format('new')}; END",
+]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('movies', '0010_library_stats'),
+    ]
+
+    operations = [
+        # Runs last when unapplying
+        migrations.RunSQL(migrations.RunSQL.noop, TRIGGERS),
+        migrations.AddField(
+            model_name='movie',
+            name='refreshed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='Refreshed at'),
+        ),
+        migrations.RunSQL(TRIGGERS, migrations.RunSQL.noop),
+        # Movies were refreshed when they were last updated until now
+        migrations.RunSQL("UPDATE movies_movie SET refreshed_at = updated_at", migrations.RunSQL.noop),
+        migrations.AddIndex(
+            model_name='movie',
+            index=models.Index(fields=['refreshed_at'], name='movie_refreshed_idx'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 from mymdb.models import Model
@@ -12,6 +13,19 @@ class Genre(Model):
 
 
 class Movie(Model):
+    class Meta:
+        indexes = [
+            models.Index(fields=["-imdb_rating", "-metascore"], name="movie_rating_idx"),
+            models.Index(
+                fields=["on_watchlist", "-imdb_rating", "-metascore"], name="movie_watchlist_rating_idx"
+            ),
+            models.Index(fields=["in_store", "-imdb_rating", "-metascore"], name="movie_store_rating_idx"),
+            models.Index(fields=["updated_at"], name="movie_updated_idx"),
+            models.Index(fields=["refreshed_at"], name="movie_refreshed_idx"),
+            # Keyset pagination of the catalog API
+            models.Index(fields=["-imdb_rating", "-id"], name="movie_rating_id_idx"),
+        ]
+
     imdb_id = models.CharField(_("IMDB ID"), max_length=150, unique=True)
     title = models.CharField(_("Title"), max_length=150)
     year = models.IntegerField(_("Year"))
@@ -19,12 +33,145 @@ class Movie(Model):
     language = models.CharField(_("Title"), max_length=150)
     awards = models.TextField(_("Awards"))
     poster = models.URLField(_("Poster"))
+    # Paths under MEDIA_ROOT of the local copies of the poster
+    poster_file = models.CharField(_("Poster file"), max_length=255, blank=True, default="", editable=False)
+    poster_thumbnail = models.CharField(
+        _("Poster thumbnail"), max_length=255, blank=True, default="", editable=False
+    )
     imdb_rating = models.FloatField(_("IMDB Rating"), null=True)
     metascore = models.FloatField(_("Metascore"), null=True)
     on_watchlist = models.BooleanField(_("On Watchlist"))
     in_store = models.BooleanField(_("In Store"))
+    # When refresh_movies last checked the ratings, whether they changed or not
+    refreshed_at = models.DateTimeField(_("Refreshed at"), default=timezone.now, editable=False)
 
     genres = models.ManyToManyField(Genre, related_name="movies")
+    # Denormalized copy of the genre titles, kept in sync by movies.signals
+    genre_titles = models.CharField(_("Genres"), max_length=1024, blank=True, default="", editable=False)
 
     def __str__(self):
         return self.title
+
+
+class StoreEntry(Model):
+    class Meta:
+        unique_together = ("root", "name")
+
+    root = models.CharField(_("Root"), max_length=1024)
+    name = models.CharField(_("Name"), max_length=1024)
+    inode = models.BigIntegerField(_("Inode"))
+    mtime = models.FloatField(_("Modified at"))
+    size = models.BigIntegerField(_("Size"))
+    imdb_id = models.CharField(_("IMDB ID"), max_length=150, null=True, db_index=True)
+
+    @property
+    def signature(self):
+        return (self.inode, self.mtime, self.size)
+
+    def __str__(self):
+        return self.name
+
+
+class ImportItem(Model):
+    """
+    An item of an import, kept so an interrupted import can be resumed.
+    """
+
+    class Meta:
+        unique_together = ("command", "key")
+
+    class State(models.TextChoices):
+        PENDING = "pending", _("Pending")
+        FETCHED = "fetched", _("Fetched")
+        WRITTEN = "written", _("Written")
+        FAILED = "failed", _("Failed")
+
+    command = models.CharField(_("Command"), max_length=150)
+    key = models.CharField(_("Key"), max_length=2048)
+    state = models.CharField(_("State"), max_length=16, choices=State.choices, default=State.PENDING)
+    attempts = models.PositiveIntegerField(_("Attempts"), default=0)
+    error = models.TextField(_("Last error"), blank=True, default="")
+    imdb_id = models.CharField(_("IMDB ID"), max_length=150, null=True)
+
+    def __str__(self):
+        return f"{self.command} {self.key}"
+
+
+class Recommendation(Model):
+    """
+    An in-store movie similar to another one, see movies.recommend.
+    """
+
+    class Meta:
+        unique_together = ("movie", "similar")
+        indexes = [models.Index(fields=["movie", "rank"], name="recommendation_rank_idx")]
+
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name="recommendations")
+    similar = models.ForeignKey(Movie, on_delete=models.CASCADE, related_name="+")
+    score = models.FloatField(_("Score"))
+    rank = models.PositiveSmallIntegerField(_("Rank"))
+
+
+class Pick(Model):
+    """
+    Ranking score of an in-store movie, see movies.recommend.
+    """
+
+    movie = models.OneToOneField(Movie, on_delete=models.CASCADE, related_name="pick")
+    score = models.FloatField(_("Score"), db_index=True)
+
+
+class RecommendationBuild(Model):
+    """
+    A build of the recommendation index; the next one only redoes what changed since.
+    """
+
+    # Changes made while the build ran are picked up by the next one
+    started_at = models.DateTimeField(_("Started at"))
+    full = models.BooleanField(_("Full"))
+    movies = models.PositiveIntegerField(_("Movies"))
+
+    @classmethod
+    def outdated(cls):
+        """
+        Whether movies were added or changed since the last build.
+        """
+        last = cls.objects.order_by("-started_at").first()
+        movies = Movie.objects.all() if last is None else Movie.objects.filter(updated_at__gte=last.started_at)
+        return movies.exists()
+
+
+class LibraryStats(Model):
+    """
+    Sums over the movies of a group, kept up to date by movies.stats.
+
+    Runtimes, ratings and metascores are summed and counted over the
+    movies that have one, to get their averages.
+    """
+
+    class Meta:
+        abstract = True
+
+    on_watchlist = models.BooleanField(_("On Watchlist"))
+    in_store = models.BooleanField(_("In Store"))
+    movies = models.IntegerField(_("Movies"), default=0)
+    runtime_sum = models.BigIntegerField(_("Runtime sum (min)"), default=0)
+    runtime_count = models.IntegerField(_("Runtime count"), default=0)
+    rating_sum = models.FloatField(_("IMDB Rating sum"), default=0)
+    rating_count = models.IntegerField(_("IMDB Rating count"), default=0)
+    metascore_sum = models.FloatField(_("Metascore sum"), default=0)
+    metascore_count = models.IntegerField(_("Metascore count"), default=0)
+
+
+class YearStats(LibraryStats):
+    class Meta:
+        unique_together = ("year", "on_watchlist", "in_store")
+
+    year = models.IntegerField(_("Year"))
+
+
+class GenreStats(LibraryStats):
+    class Meta:
+        unique_together = ("genre", "on_watchlist", "in_store")
+
+    genre = models.ForeignKey(Genre, on_delete=models.CASCADE, related_name="+")
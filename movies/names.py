@@ -0,0 +1,117 @@
+import re
+import unicodedata
+from collections import defaultdict
+
+VIDEO_EXTENSIONS = {
+    ".avi", ".divx", ".flv", ".iso", ".m2ts", ".m4v", ".mkv", ".mov", ".mp4", ".mpeg", ".mpg", ".ogm", ".ts",
+    ".vob", ".webm", ".wmv",
+}
+# Folders holding a DVD or Blu-ray structure, the folder they're in is the movie
+DISC_FOLDERS = {"VIDEO_TS", "BDMV"}
+
+# Release tokens that never belong to a title
+RELEASE_TOKENS = {
+    "360p", "480p", "576p", "720p", "1080p", "1080i", "2160p", "4k", "uhd", "hdr", "hdr10", "sdr",
+    "bluray", "blu-ray", "bdrip", "brrip", "bdremux", "remux", "webrip", "web-dl", "webdl", "hdtv", "hdrip",
+    "dvdrip", "dvdscr", "hdcam", "x264", "x265", "h264", "h265", "hevc", "avc", "xvid", "divx", "10bit",
+    "8bit", "aac", "ac3", "dts", "dts-hd", "ddp5", "truehd", "atmos",
+}
+# Release tokens that are also plain words, like in "Charlotte's Web"; they
+# only end the title of a release name without a year
+RELEASE_WORDS = {
+    "web", "dvd", "cam", "ts", "dv", "flac", "proper", "repack", "extended", "unrated", "remastered",
+    "internal", "limited", "multi", "dual", "subbed", "dubbed", "imax", "criterion",
+}
+
+_year = re.compile(r"^(19|20)\d\d$")
+_brackets = re.compile(r"\[(?!(?:19|20)\d\d\])[^\]]*\]|\{[^}]*\}")
+_separators = re.compile(r"[._\s]+")
+_articles = re.compile(r"^(the|a|an) ")
+# Part of a multi-part movie, like "cd1" in "Heat.cd1.avi" or a "CD2" folder
+_part = re.compile(r"(?<![^\W_])(?:cd|dvd|disc|disk|pt|part)\d{1,2}(?![^\W_])", re.IGNORECASE)
+
+
+def without_part(name):
+    """
+    Remove the part number of a multi-part movie from a name.
+
+    "Heat.cd2.avi" gives "Heat..avi"; names without one give None.
+    """
+    stripped, count = _part.subn("", name)
+    return stripped if count else None
+
+
+def parse_name(name):
+    """
+    Extract the title and year of a movie from a file or folder name.
+
+    "The.Matrix.1999.1080p.BluRay.x264-GROUP.mkv" gives ("The Matrix", 1999).
+    The year is None when the name doesn't have one.
+    """
+    stem, ext = re.match(r"(.*?)(\.[^.]*)?$", name).groups()
+    if not ext or ext.lower() not in VIDEO_EXTENSIONS:
+        stem = name
+
+    stem = _brackets.sub(" ", stem)
+    tokens = [token.strip("()[]") for token in _separators.split(stem.strip())]
+    tokens = [token for token in tokens if token]
+    keys = [token.lower() for token in tokens]
+
+    end = next((i for i, key in enumerate(keys) if key in RELEASE_TOKENS or _part.fullmatch(key)), len(tokens))
+    # A year first is the title itself, like "1917" or "2012"
+    years = [i for i in range(1, end) if _year.match(keys[i])]
+    if years:
+        return " ".join(tokens[: years[-1]]).strip(" -"), int(keys[years[-1]])
+
+    if end < len(tokens):
+        end = next((i for i, key in enumerate(keys[:end]) if i and key in RELEASE_WORDS), end)
+    return " ".join(tokens[:end]).strip(" -"), None
+
+
+def normalize_title(title):
+    """
+    Reduce a title to a key that ignores case, accents, punctuation and a
+    leading article.
+    """
+    title = unicodedata.normalize("NFKD", title)
+    title = "".join(c for c in title if not unicodedata.combining(c)).lower()
+    title = re.sub(r"&", " and ", title)
+    title = " ".join(re.sub(r"[^\w\s]", " ", title).split())
+    return _articles.sub("", title)
+
+
+class TitleIndex:
+    """
+    In-memory index of known movies by normalized title and year.
+    """
+
+    def __init__(self, movies=()):
+        self.titles = defaultdict(list)
+        for title, year, imdb_id in movies:
+            self.add(title, year, imdb_id)
+
+    @classmethod
+    def from_db(cls):
+        from .models import Movie
+
+        return cls(Movie.objects.values_list("title", "year", "imdb_id").iterator())
+
+    def add(self, title, year, imdb_id):
+        self.titles[normalize_title(title)].append((year, imdb_id))
+
+    def match(self, title, year=None):
+        """
+        Return the IMDb ID of the known movie with this title, or None.
+
+        With a year, a movie from that year (or one year off, as release
+        years differ between countries) is required; without one the title
+        must be unambiguous.
+        """
+        candidates = self.titles.get(normalize_title(title), [])
+        if year is None:
+            return candidates[0][1] if len(candidates) == 1 else None
+        for delta in (0, 1, -1):
+            matches = [imdb_id for candidate_year, imdb_id in candidates if candidate_year == year + delta]
+            if len(matches) == 1:
+                return matches[0]
+        return None
@@ -1,17 +1,18 @@
 
-import requests
 from django.conf import settings
 
+from .cache import NullCache
 
-def _call_api(params):
-    resp = requests.get(
-        settings.OMDB_API_URL, params={"apikey": settings.OMDB_API_KEY, 'type': 'movie', **params}
-    )
-    resp.raise_for_status()
-    data = resp.json()
 
-    if data["Response"] != "True":
-        raise Exception(data["Error"])
+def _call_api(params, cache=None, session=None):
+    cache = cache or NullCache()
+    key = f"omdb:{sorted(params.items())}"
+    data = cache.get(key)
+    if data is None:
+        data = _request(params, session)
+        if data["Response"] != "True":
+            raise Exception(data["Error"])
+        cache.set(key, data)
 
     if data["Type"] != "movie":
         raise Exception(f'{data["Title"]} is not a movie.')
@@ -19,11 +20,23 @@ def _call_api(params):
     return data
 
 
-def fetch_movie_by_id(id):
+def _request(params, session=None):
+    if session is None:
+        import requests as session
+    resp = session.get(
+        settings.OMDB_API_URL, params={"apikey": settings.OMDB_API_KEY, 'type': 'movie', **params}
+    )
+    resp.raise_for_status()
+    return resp.json()
+
+
+def fetch_movie_by_id(id, cache=None, session=None):
     params = {'i': id}
-    return _call_api(params)
+    return _call_api(params, cache, session)
 
 
-def fetch_movie_by_title(title):
+def fetch_movie_by_title(title, cache=None, session=None, year=None):
     params = {'t': title}
-    return _call_api(params)
+    if year:
+        params['y'] = year
+    return _call_api(params, cache, session)
@@ -0,0 +1,108 @@
+import hashlib
+import io
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+from mymdb.db import serialized_write
+
+from .models import Movie
+
+logger = logging.getLogger(__name__)
+
+POSTERS_DIR = "posters"
+
+
+def poster_paths(content):
+    """
+    Return the content-addressed paths, relative to MEDIA_ROOT, of a poster
+    and its thumbnail.
+    """
+    digest = hashlib.sha256(content).hexdigest()
+    base = os.path.join(POSTERS_DIR, digest[:2], digest)
+    return f"{base}.jpg", f"{base}-thumb.jpg"
+
+
+def make_thumbnail(content):
+    """
+    Return a JPEG thumbnail of a poster, or None without Pillow.
+    """
+    # Pillow is slow to import, only the runs that download a poster load it
+    try:
+        from PIL import Image
+    except ImportError:  # Thumbnails fall back to the original poster
+        return None
+
+    with Image.open(io.BytesIO(content)) as image:
+        image = image.convert("RGB")
+        image.thumbnail(settings.POSTER_THUMBNAIL_SIZE)
+        out = io.BytesIO()
+        image.save(out, "JPEG", quality=85, optimize=True, progressive=True)
+        return out.getvalue()
+
+
+def _write(path, content):
+    path = os.path.join(settings.MEDIA_ROOT, path)
+    if os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Several threads may write the same poster at once
+    with tempfile.NamedTemporaryFile(dir=os.path.dirname(path), suffix=".tmp", delete=False) as f:
+        f.write(content)
+    os.replace(f.name, path)
+
+
+def store_poster(content):
+    """
+    Save a poster and its thumbnail under MEDIA_ROOT and return their paths.
+    """
+    path, thumbnail = poster_paths(content)
+    _write(path, content)
+    thumbnail_content = make_thumbnail(content)
+    if thumbnail_content is None:
+        return path, path
+    _write(thumbnail, thumbnail_content)
+    return path, thumbnail
+
+
+class PosterDownloader:
+    """
+    Download the posters of imported movies in the background.
+
+    ``add`` queues the poster of a record and returns at once; ``save``
+    waits for the downloads and records the local paths on the movies.
+    """
+
+    def __init__(self, engine, concurrency=None):
+        self.engine = engine
+        self.pool = ThreadPoolExecutor(max_workers=concurrency or settings.POSTER_DOWNLOAD_CONCURRENCY)
+        self.futures = {}
+
+    def download(self, url):
+        resp = self.engine.get(url, timeout=30)
+        resp.raise_for_status()
+        return store_poster(resp.content)
+
+    def add(self, record):
+        url = record.get("poster")
+        if url and record["imdb_id"] not in self.futures:
+            self.futures[record["imdb_id"]] = self.pool.submit(self.download, url)
+
+    def save(self):
+        self.pool.shutdown(wait=True)
+        paths = {}
+        for imdb_id, future in self.futures.items():
+            try:
+                paths[imdb_id] = future.result()
+            except Exception as e:
+                logger.warning(f"Failed to download the poster of {imdb_id}: {e}")
+
+        movies = list(Movie.objects.filter(imdb_id__in=list(paths), poster_file="").only("pk", "imdb_id"))
+        for movie in movies:
+            movie.poster_file, movie.poster_thumbnail = paths[movie.imdb_id]
+        with serialized_write():
+            Movie.objects.bulk_update(movies, ["poster_file", "poster_thumbnail"], batch_size=500)
+        return len(movies)
@@ -0,0 +1,229 @@
+from django.utils.functional import cached_property
+
+from . import omdb
+from .fetch import SingleFlight
+from .ingest import complete, missing_fields, movie_from_imdb, movie_from_omdb
+from .names import normalize_title
+
+IMDB_HOST = "www.imdb.com"
+
+# Fields that change after a movie is released
+RATING_FIELDS = ("imdb_rating", "metascore")
+
+# Provider factories by name, taking the engine and the cache
+PROVIDERS = {}
+
+
+def register(name):
+    def decorator(factory):
+        PROVIDERS[name] = factory
+        return factory
+
+    return decorator
+
+
+class Provider:
+    """
+    Source of movie metadata.
+
+    ``lookup`` resolves a free-text query (and optionally the release year)
+    to the best matching movie and
+    ``get`` fetches a movie by IMDb ID (with the "tt" prefix). Both return
+    a normalized record with no flags set and raise on failure. ``ratings``
+    returns only the rating fields the source knows of a movie.
+    """
+
+    name = None
+
+    def __init__(self, engine, cache):
+        self.engine = engine
+        self.cache = cache
+
+    def lookup(self, query, year=None):
+        raise NotImplementedError
+
+    def get(self, imdb_id):
+        raise NotImplementedError
+
+    def ratings(self, imdb_id):
+        record = self.get(imdb_id)
+        return {
+            field: record[field] for field in RATING_FIELDS if record.get(field) is not None and record[field] >= 0
+        }
+
+
+@register("imdb")
+class IMDbProvider(Provider):
+    """
+    Scrape the IMDb website with IMDbPY.
+    """
+
+    name = "imdb"
+
+    @cached_property
+    def imdb(self):
+        # IMDbPY and its parsers are only loaded by the runs that use them
+        from imdb import IMDb
+
+        return IMDb()
+
+    def search(self, query, year=None):
+        def search():
+            with self.engine.metrics.stage("search"):
+                results = self.engine.call(IMDB_HOST, self.imdb.search_movie, query, results=5 if year else 1)
+            # Prefer the first result released that year, or within a year of it
+            for delta in (0, 1, -1) if year else ():
+                for result in results:
+                    if result.get("year") == year + delta:
+                        return result.movieID
+            return results[0].movieID
+
+        key = f"imdb:search:{query}" if year is None else f"imdb:search:{query}:{year}"
+        return self.cache.get_or_set(key, search)
+
+    def fetch(self, movie_id, movies_only):
+        def fetch():
+            with self.engine.metrics.stage("detail"):
+                data = self.engine.call(
+                    IMDB_HOST, self.imdb.get_movie, movie_id, info=["main", "critic_reviews"]
+                )
+            if movies_only and data["kind"] != "movie":
+                raise Exception(f'{data["title"]} is not a movie.')
+            return movie_from_imdb(data)
+
+        return self.cache.get_or_set(f"imdb:movie:{movie_id}", fetch)
+
+    def lookup(self, query, year=None):
+        return self.fetch(self.search(query, year), movies_only=False)
+
+    def get(self, imdb_id):
+        return self.fetch(imdb_id[2:], movies_only=True)
+
+
+@register("omdb")
+class OMDbProvider(Provider):
+    """
+    Query the OMDb API, one JSON response per movie.
+    """
+
+    name = "omdb"
+
+    def lookup(self, query, year=None):
+        with self.engine.metrics.stage("search"):
+            data = omdb.fetch_movie_by_title(query, self.cache, self.engine, year=year)
+        return movie_from_omdb(data)
+
+    def get(self, imdb_id):
+        with self.engine.metrics.stage("detail"):
+            data = omdb.fetch_movie_by_id(imdb_id, self.cache, self.engine)
+        return movie_from_omdb(data)
+
+
+class FallbackProvider(Provider):
+    """
+    Use the primary provider, and the fallback one when it fails or leaves
+    fields missing.
+    """
+
+    def __init__(self, primary, fallback):
+        super().__init__(primary.engine, primary.cache)
+        self.primary = primary
+        self.fallback = fallback
+        self.name = f"{primary.name}+{fallback.name}"
+
+    def fill(self, record):
+        if missing_fields(record):
+            try:
+                record = {**self.fallback.get(record["imdb_id"]), **record}
+            except Exception:
+                pass
+        return record
+
+    def lookup(self, query, year=None):
+        try:
+            record = self.primary.lookup(query, year)
+        except Exception:
+            return self.fallback.lookup(query, year)
+        return self.fill(record)
+
+    def get(self, imdb_id):
+        try:
+            record = self.primary.get(imdb_id)
+        except Exception:
+            return self.fallback.get(imdb_id)
+        return self.fill(record)
+
+    def ratings(self, imdb_id):
+        # A rating the primary doesn't know isn't worth a whole fallback record
+        try:
+            return self.primary.ratings(imdb_id)
+        except Exception:
+            return self.fallback.ratings(imdb_id)
+
+
+class CompleteProvider(Provider):
+    """
+    Make sure every record a provider returns has all the fields.
+    """
+
+    def __init__(self, provider):
+        super().__init__(provider.engine, provider.cache)
+        self.provider = provider
+        self.name = provider.name
+
+    def lookup(self, query, year=None):
+        return complete(self.provider.lookup(query, year))
+
+    def get(self, imdb_id):
+        return complete(self.provider.get(imdb_id))
+
+    def ratings(self, imdb_id):
+        return self.provider.ratings(imdb_id)
+
+
+class SharedProvider(Provider):
+    """
+    Fetch every title once per run.
+
+    Lookups of the same normalized query and year, and gets of the same
+    IMDb ID, share a single call, whether they run concurrently (folders
+    of the same film) or one after the other. A lookup also answers the
+    later gets of the movie it found.
+    """
+
+    def __init__(self, provider):
+        super().__init__(provider.engine, provider.cache)
+        self.provider = provider
+        self.name = provider.name
+        self.flight = SingleFlight(provider.engine.metrics)
+
+    def lookup(self, query, year=None):
+        record = self.flight.do(("lookup", normalize_title(query) or query, year), self.provider.lookup, query, year)
+        self.flight.seed(("get", record["imdb_id"]), record)
+        # Callers add their flags to the record
+        return dict(record)
+
+    def get(self, imdb_id):
+        return dict(self.flight.do(("get", imdb_id), self.provider.get, imdb_id))
+
+    def ratings(self, imdb_id):
+        return self.provider.ratings(imdb_id)
+
+
+@register("auto")
+def auto_provider(engine, cache):
+    """
+    OMDb backed by IMDbPY.
+    """
+    return FallbackProvider(OMDbProvider(engine, cache), IMDbProvider(engine, cache))
+
+
+def get_provider(name, engine, cache):
+    """
+    Build the provider registered under name.
+    """
+    try:
+        factory = PROVIDERS[name]
+    except KeyError:
+        raise ValueError(f'Unknown provider "{name}"')
+    return SharedProvider(CompleteProvider(factory(engine, cache)))
@@ -0,0 +1,199 @@
+import logging
+
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from mymdb.db import serialized_write
+
+from .models import Movie, Pick, Recommendation, RecommendationBuild
+
+try:
+    import numpy as np
+except ImportError:  # Recommendations aren't built without NumPy
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# Number of similar movies kept for every movie
+NEIGHBORS = 10
+# Movies whose similarities are computed at once, bounding the memory used
+CHUNK_SIZE = 512
+
+# "More like this" mixes genre similarity with the quality of the candidate
+SIMILARITY_WEIGHTS = {"genres": 0.75, "quality": 0.25}
+# Top picks mix quality, affinity with the watchlist genres and being on it
+PICK_WEIGHTS = {"quality": 0.5, "affinity": 0.3, "watchlist": 0.2}
+
+
+class Features:
+    """
+    Feature matrix of the whole library.
+
+    Every movie gets an L2-normalized genre vector (so dot products are
+    cosine similarities) and a quality in [0, 1] blending its IMDb rating
+    and metascore; unknown values take the library mean.
+    """
+
+    def __init__(self):
+        rows = list(Movie.objects.values_list("pk", "imdb_rating", "metascore", "on_watchlist", "in_store"))
+        self.ids = [row[0] for row in rows]
+        self.index = {pk: i for i, pk in enumerate(self.ids)}
+
+        links = list(Movie.genres.through.objects.values_list("movie_id", "genre_id"))
+        genre_index = {genre_id: i for i, genre_id in enumerate(sorted({genre_id for _, genre_id in links}))}
+        self.genres = np.zeros((len(rows), max(len(genre_index), 1)), dtype=np.float32)
+        if links:
+            self.genres[
+                [self.index[movie_id] for movie_id, _ in links], [genre_index[genre_id] for _, genre_id in links]
+            ] = 1
+        norms = np.linalg.norm(self.genres, axis=1, keepdims=True)
+        self.genres /= np.where(norms == 0, 1, norms)
+
+        rating = self.scaled([row[1] for row in rows], 10)
+        metascore = self.scaled([row[2] for row in rows], 100)
+        self.quality = (rating + metascore) / 2
+        self.on_watchlist = np.array([row[3] for row in rows], dtype=bool)
+        self.in_store = np.array([row[4] for row in rows], dtype=bool)
+        self.candidates = np.flatnonzero(self.in_store)
+
+    @staticmethod
+    def scaled(values, top):
+        values = np.array([-1 if value is None else value for value in values], dtype=np.float32)
+        known = values >= 0
+        values[~known] = values[known].mean() if known.any() else top / 2
+        return np.clip(values / top, 0, 1)
+
+    def similarities(self, rows, columns):
+        """
+        Scores of the candidate movies ``columns`` for the movies ``rows``,
+        both arrays of matrix indices.
+        """
+        scores = SIMILARITY_WEIGHTS["genres"] * (self.genres[rows] @ self.genres[columns].T)
+        scores += SIMILARITY_WEIGHTS["quality"] * self.quality[columns]
+        # A movie isn't similar to itself
+        scores[rows[:, None] == columns[None, :]] = -np.inf
+        return scores
+
+    def picks(self):
+        """
+        Scores of the in-store movies for the top picks.
+        """
+        profile = self.genres[self.on_watchlist].sum(axis=0)
+        norm = np.linalg.norm(profile)
+        affinity = self.genres[self.candidates] @ (profile / norm) if norm else 0
+        return (
+            PICK_WEIGHTS["quality"] * self.quality[self.candidates]
+            + PICK_WEIGHTS["affinity"] * affinity
+            + PICK_WEIGHTS["watchlist"] * self.on_watchlist[self.candidates]
+        )
+
+
+def stale_movies(features, since):
+    """
+    Indices of the movies whose similar movies may have changed since the
+    last build.
+    """
+    changed = set(Movie.objects.filter(updated_at__gte=since).values_list("pk", flat=True))
+    stale = set(changed)
+    # Movies recommending a changed one, whose score moved or which left the store
+    stale.update(
+        Recommendation.objects.filter(similar__updated_at__gte=since).values_list("movie_id", flat=True).distinct()
+    )
+
+    lists = {
+        row["movie_id"]: row
+        for row in Recommendation.objects.values("movie_id").annotate(count=Count("pk"), worst=Min("score"))
+    }
+    # Short lists, of new movies or of ones whose similar movies were deleted
+    expected = min(NEIGHBORS, max(len(features.candidates) - 1, 0))
+    stale.update(pk for pk in features.ids if (lists[pk]["count"] if pk in lists else 0) < expected)
+
+    # Movies a changed in-store movie now beats the worst similar movie of
+    new = np.array([features.index[pk] for pk in changed if pk in features.index], dtype=np.int64)
+    new = new[features.in_store[new]]
+    if len(new):
+        thresholds = np.array([lists[pk]["worst"] if pk in lists else -np.inf for pk in features.ids], dtype=np.float32)
+        for start in range(0, len(features.ids), CHUNK_SIZE):
+            rows = np.arange(start, min(start + CHUNK_SIZE, len(features.ids)))
+            best = np.full(len(rows), -np.inf, dtype=np.float32)
+            for columns in np.array_split(new, -(-len(new) // CHUNK_SIZE)):
+                best = np.maximum(best, features.similarities(rows, columns).max(axis=1))
+            beaten = best > thresholds[rows]
+            stale.update(features.ids[i] for i in rows[beaten])
+
+    return np.array(sorted(features.index[pk] for pk in stale if pk in features.index), dtype=np.int64)
+
+
+def write_recommendations(features, rows):
+    """
+    Replace the similar movies of the movies ``rows``.
+    """
+    candidates = features.candidates
+    k = min(NEIGHBORS, len(candidates))
+    for start in range(0, len(rows), CHUNK_SIZE):
+        chunk = rows[start : start + CHUNK_SIZE]
+        recommendations = []
+        if k:
+            scores = features.similarities(chunk, candidates)
+            best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            for row, row_scores, columns in zip(chunk, scores, best):
+                columns = columns[np.argsort(-row_scores[columns])]
+                recommendations += [
+                    Recommendation(
+                        movie_id=features.ids[row],
+                        similar_id=features.ids[candidates[column]],
+                        score=float(row_scores[column]),
+                        rank=rank,
+                    )
+                    for rank, column in enumerate(columns)
+                    if np.isfinite(row_scores[column])
+                ]
+        with serialized_write():
+            Recommendation.objects.filter(movie_id__in=[features.ids[row] for row in chunk]).delete()
+            Recommendation.objects.bulk_create(recommendations, batch_size=1000)
+
+
+def write_picks(features):
+    """
+    Update the top picks scores, only writing the ones that changed.
+    """
+    scores = dict(zip((features.ids[i] for i in features.candidates), map(float, features.picks())))
+    existing = {pick.movie_id: pick for pick in Pick.objects.all()}
+    to_update = [pick for movie_id, pick in existing.items() if movie_id in scores and pick.score != scores[movie_id]]
+    for pick in to_update:
+        pick.score = scores[pick.movie_id]
+        pick.updated_at = timezone.now()
+    with serialized_write():
+        Pick.objects.exclude(movie__in_store=True).delete()
+        Pick.objects.bulk_update(to_update, ["score", "updated_at"], batch_size=1000)
+        Pick.objects.bulk_create(
+            [Pick(movie_id=movie_id, score=score) for movie_id, score in scores.items() if movie_id not in existing],
+            batch_size=1000,
+        )
+
+
+def build(full=False):
+    """
+    Update the recommendation index and return the number of movies whose
+    similar movies were recomputed.
+
+    Only the movies affected by the changes since the last build are
+    redone, unless ``full`` is set or there was no build yet. Returns None
+    when NumPy isn't installed.
+    """
+    if np is None:
+        logger.warning("NumPy isn't installed, not building recommendations")
+        return None
+
+    started_at = timezone.now()
+    last = RecommendationBuild.objects.order_by("-started_at").first()
+    full = full or last is None
+    features = Features()
+    rows = np.arange(len(features.ids)) if full else stale_movies(features, last.started_at)
+
+    write_recommendations(features, rows)
+    write_picks(features)
+    with serialized_write():
+        RecommendationBuild.objects.create(started_at=started_at, full=full, movies=len(rows))
+    logger.info(f"Recommendations of {len(rows)} movies rebuilt")
+    return len(rows)
@@ -0,0 +1,124 @@
+import logging
+import os
+import queue
+import re
+import threading
+from fnmatch import fnmatch
+
+from .names import DISC_FOLDERS, VIDEO_EXTENSIONS, without_part
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_IGNORE = (".*", "@eaDir", "$RECYCLE.BIN", "System Volume Information", "lost+found")
+
+_sample = re.compile(r"(^|[\W_])sample([\W_]|$)", re.IGNORECASE)
+
+
+def signature(entry):
+    stat = entry.stat()
+    return (stat.st_ino, stat.st_mtime, stat.st_size)
+
+
+class Scanner:
+    """
+    Walk store roots in parallel and yield the movies found in them.
+
+    A movie is either a folder holding a single video file (samples and
+    parts of a multi-part movie aside), a folder holding a DVD or Blu-ray
+    structure or only part folders ("CD1", "CD2"), or a video file sitting
+    next to other ones in a collection folder, the parts of a multi-part
+    movie counting as one. Folders without video files are walked into,
+    down to ``max_depth`` levels below the root. Iterating yields
+    ``(root, name, signature)`` tuples as soon as they are found, ``name``
+    being the path of the movie relative to its root and ``signature`` the
+    (inode, mtime, size) of its (first) video file, or of its disc or
+    first part folder.
+
+    Only ``os.scandir`` file types are used to walk, so the video files
+    and the disc and part folders are the only entries that get a ``stat``
+    call. Roots that couldn't be walked completely end up in ``failed``.
+    """
+
+    def __init__(self, roots, max_depth=3, ignore=DEFAULT_IGNORE, extensions=VIDEO_EXTENSIONS):
+        self.roots = roots
+        self.max_depth = max_depth
+        self.ignore = ignore
+        self.extensions = extensions
+        self.failed = set()
+
+    def ignored(self, name):
+        return any(fnmatch(name, pattern) for pattern in self.ignore)
+
+    def is_video(self, entry):
+        name, ext = os.path.splitext(entry.name)
+        return ext.lower() in self.extensions and not _sample.search(name) and entry.is_file()
+
+    @staticmethod
+    def movies(videos):
+        """
+        Keep the first video file of each movie, the parts of a multi-part
+        movie counting as one.
+        """
+        movies = {}
+        for video in sorted(videos, key=lambda entry: entry.name):
+            key = without_part(video.name)
+            movies.setdefault(video.name if key is None else key.lower(), video)
+        return list(movies.values())
+
+    def walk(self, root, emit):
+        stack = [(root, 0)]
+        while stack:
+            path, depth = stack.pop()
+            try:
+                with os.scandir(path) as entries:
+                    entries = [entry for entry in entries if not self.ignored(entry.name)]
+                folders = sorted(
+                    (entry for entry in entries if entry.is_dir(follow_symlinks=False)), key=lambda entry: entry.name
+                )
+                discs = [entry for entry in folders if entry.name.upper() in DISC_FOLDERS]
+                parts = [entry for entry in folders if without_part(entry.name) == ""]
+                videos = self.movies(entry for entry in entries if self.is_video(entry))
+
+                if depth > 0 and discs:
+                    emit(root, os.path.relpath(path, root), signature(discs[0]))
+                    continue
+                if depth > 0 and parts and len(parts) == len(folders) and not videos:
+                    emit(root, os.path.relpath(path, root), signature(parts[0]))
+                    continue
+                if depth > 0 and len(videos) == 1:
+                    emit(root, os.path.relpath(path, root), signature(videos[0]))
+                    continue
+                for video in videos:
+                    emit(root, os.path.relpath(video.path, root), signature(video))
+            except OSError as e:
+                logger.error(f'Failed to scan "{path}": {e}')
+                self.failed.add(root)
+                continue
+
+            if depth < self.max_depth:
+                stack.extend((entry.path, depth + 1) for entry in folders if entry not in discs)
+
+    def __iter__(self):
+        found = queue.Queue()
+        done = object()
+
+        def walk(root):
+            try:
+                self.walk(root, lambda *movie: found.put(movie))
+            except Exception as e:
+                logger.error(f'Failed to scan "{root}": {e}')
+                self.failed.add(root)
+            finally:
+                found.put(done)
+
+        threads = [threading.Thread(target=walk, args=(root,), daemon=True) for root in self.roots]
+        for thread in threads:
+            thread.start()
+
+        remaining = len(threads)
+        while remaining:
+            movie = found.get()
+            if movie is done:
+                remaining -= 1
+            else:
+                yield movie
@@ -0,0 +1,114 @@
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+MIN_TERM_LENGTH = 3
+
+# The index is kept in sync with movies_movie by triggers, see
+# migrations/0004_movie_search.py. SQLite migrations that alter movies_movie
+# rebuild the table, which drops the triggers, so they have to create them
+# again like migrations/0005_movie_poster_files.py does.
+
+# bm25 weights of the indexed columns: title, genre_titles, language, awards
+RANK = "bm25(movies_movie_fts, 0, 10.0, 2.0, 1.0, 0.5)"
+
+
+def _quote(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def terms(query):
+    """
+    Split a query into the words the trigram index can match.
+    """
+    return [term for term in re.split(r"\s+", query.strip()) if len(term) >= MIN_TERM_LENGTH]
+
+
+def short_terms(query):
+    """
+    The words of a query too short for the trigram index.
+    """
+    return [term for term in re.split(r"\s+", query.strip()) if 0 < len(term) < MIN_TERM_LENGTH]
+
+
+def _in_title(terms):
+    """
+    SQL condition and parameters requiring every term in the title.
+    """
+    patterns = ["%" + re.sub(r"([\\%_])", r"\\\1", term) + "%" for term in terms]
+    return " AND ".join(["movies_movie.title LIKE %s ESCAPE '\\'"] * len(patterns)), patterns
+
+
+def exact_expression(query):
+    """
+    FTS5 expression matching movies containing every word of the query.
+    """
+    return " AND ".join(_quote(term) for term in terms(query))
+
+
+def fuzzy_expression(query):
+    """
+    FTS5 expression matching movies sharing any trigram with the query.
+
+    Ranking by bm25 puts the movies sharing the most trigrams first, which
+    tolerates typos and word order.
+    """
+    trigrams = {
+        term[i:i + 3].lower() for term in terms(query) for i in range(len(term) - MIN_TERM_LENGTH + 1)
+    }
+    return " OR ".join(_quote(trigram) for trigram in sorted(trigrams))
+
+
+def matching(query):
+    """
+    Subquery of the IDs of the movies containing every word of the query,
+    for use as ``Movie.objects.filter(pk__in=matching(query))``.
+    """
+    return RawSQL(
+        "SELECT movie_id FROM movies_movie_fts WHERE movies_movie_fts MATCH %s", (exact_expression(query),)
+    )
+
+
+def _ranked(expression, limit, short=()):
+    join, where, params = "", "", []
+    if short:
+        in_title, params = _in_title(short)
+        join, where = " JOIN movies_movie ON movies_movie.id = movies_movie_fts.movie_id", f" AND {in_title}"
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT movie_id FROM movies_movie_fts{join} "
+            f"WHERE movies_movie_fts MATCH %s{where} ORDER BY {RANK} LIMIT %s",
+            (expression, *params, limit),
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _titled(short, limit):
+    # Without a word the index can match, the shortest titles come first
+    in_title, params = _in_title(short)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT id FROM movies_movie WHERE {in_title} ORDER BY length(title), title LIMIT %s",
+            (*params, limit),
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search(query, limit=20, fuzzy=True):
+    """
+    Return the IDs of the movies best matching the query, best first.
+
+    Movies containing every word come first; when there aren't enough of
+    them, the closest fuzzy matches follow. Words too short for the trigram
+    index, like "Up" or the "4" of "Rocky 4", have to be in the title.
+    """
+    short = short_terms(query)
+    if not terms(query):
+        return _titled(short, limit) if short else []
+
+    ids = _ranked(exact_expression(query), limit, short)
+    if fuzzy and len(ids) < limit:
+        seen = set(ids)
+        ids += [id for id in _ranked(fuzzy_expression(query), limit * 2) if id not in seen]
+    return ids[:limit]
@@ -0,0 +1,155 @@
+from collections import defaultdict
+
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .caching import MOVIES, invalidate
+from .models import Genre, Movie
+from .stats import STATS_FIELDS, StatsDelta, movie_genre_ids, stats_row
+
+
+def join_genre_titles(titles):
+    return ", ".join(sorted(set(titles)))
+
+
+def refresh_genre_titles(movie_ids):
+    """
+    Recompute ``Movie.genre_titles`` of the given movies.
+    """
+    movie_ids = set(movie_ids)
+    if not movie_ids:
+        return
+
+    titles = defaultdict(list)
+    for movie_id, title in Movie.genres.through.objects.filter(movie_id__in=movie_ids).values_list(
+        "movie_id", "genre__title"
+    ):
+        titles[movie_id].append(title)
+
+    movies = Movie.objects.filter(pk__in=movie_ids).only("pk", "genre_titles")
+    now = timezone.now()
+    changed = []
+    for movie in movies:
+        genre_titles = join_genre_titles(titles[movie.pk])
+        if movie.genre_titles != genre_titles:
+            movie.genre_titles = genre_titles
+            # The catalog API validates cached copies with updated_at
+            movie.updated_at = now
+            changed.append(movie)
+    Movie.objects.bulk_update(changed, ["genre_titles", "updated_at"])
+
+
+@receiver(m2m_changed, sender=Movie.genres.through)
+def movie_genres_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ("post_add", "post_remove", "post_clear"):
+            refresh_genre_titles([instance.pk])
+    elif action == "pre_clear":
+        instance._cleared_movie_ids = list(instance.movies.values_list("pk", flat=True))
+    elif action == "post_clear":
+        refresh_genre_titles(getattr(instance, "_cleared_movie_ids", []))
+    elif action in ("post_add", "post_remove"):
+        refresh_genre_titles(pk_set)
+
+
+@receiver(post_save, sender=Genre)
+def genre_saved(sender, instance, created, **kwargs):
+    if not created:
+        refresh_genre_titles(instance.movies.values_list("pk", flat=True))
+
+
+@receiver(pre_delete, sender=Genre)
+def genre_deleting(sender, instance, **kwargs):
+    instance._deleted_movie_ids = list(instance.movies.values_list("pk", flat=True))
+
+
+@receiver(post_delete, sender=Genre)
+def genre_deleted(sender, instance, **kwargs):
+    refresh_genre_titles(getattr(instance, "_deleted_movie_ids", []))
+
+
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+def genre_ids_changed(sender, created=False, **kwargs):
+    # movies.ingest imports this module
+    from .ingest import genre_ids
+
+    if not created:
+        genre_ids.clear()
+
+
+@receiver(post_save, sender=Movie)
+def movie_saved(sender, instance, created, **kwargs):
+    if created:
+        # New movies count towards their genres
+        invalidate()
+    else:
+        invalidate(MOVIES)
+
+
+@receiver(post_delete, sender=Movie)
+@receiver(post_save, sender=Genre)
+@receiver(post_delete, sender=Genre)
+def catalog_changed(sender, **kwargs):
+    invalidate()
+
+
+@receiver(m2m_changed, sender=Movie.genres.through)
+def movie_genres_invalidated(sender, action, **kwargs):
+    if action.startswith("post_"):
+        invalidate()
+
+
+@receiver(pre_save, sender=Movie)
+def movie_stats_saving(sender, instance, **kwargs):
+    instance._stats_row = Movie.objects.filter(pk=instance.pk).values(*STATS_FIELDS).first()
+
+
+@receiver(post_save, sender=Movie)
+def movie_stats_saved(sender, instance, **kwargs):
+    old, new = getattr(instance, "_stats_row", None), stats_row(instance)
+    if old == new:
+        return
+    delta = StatsDelta()
+    genre_ids = movie_genre_ids([instance.pk])[instance.pk]
+    if old is None:
+        delta.add(new, genre_ids)
+    else:
+        delta.change(old, new, genre_ids)
+    delta.save()
+
+
+@receiver(pre_delete, sender=Movie)
+def movie_stats_deleting(sender, instance, **kwargs):
+    instance._stats_genre_ids = movie_genre_ids([instance.pk])[instance.pk]
+
+
+@receiver(post_delete, sender=Movie)
+def movie_stats_deleted(sender, instance, **kwargs):
+    delta = StatsDelta()
+    delta.remove(stats_row(instance), getattr(instance, "_stats_genre_ids", []))
+    delta.save()
+
+
+@receiver(m2m_changed, sender=Movie.genres.through)
+def movie_genres_stats(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "pre_clear":
+        if reverse:
+            instance._stats_movie_ids = list(instance.movies.values_list("pk", flat=True))
+        else:
+            instance._stats_genre_ids = movie_genre_ids([instance.pk])[instance.pk]
+        return
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    sign = 1 if action == "post_add" else -1
+    delta = StatsDelta()
+    if not reverse:
+        genre_ids = getattr(instance, "_stats_genre_ids", []) if action == "post_clear" else pk_set
+        delta.add_genres(stats_row(instance), genre_ids, sign)
+    else:
+        movie_ids = getattr(instance, "_stats_movie_ids", []) if action == "post_clear" else pk_set
+        for row in Movie.objects.filter(pk__in=movie_ids).values(*STATS_FIELDS):
+            delta.add_genres(row, [instance.pk], sign)
+    delta.save()
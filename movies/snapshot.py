@@ -0,0 +1,292 @@
+import datetime
+import gzip
+import json
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+
+from django.db import models
+from django.utils import timezone
+
+from mymdb.db import serialized_write
+
+from .caching import invalidate
+from .models import Genre, Movie
+from .stats import rebuild as rebuild_stats
+from .signals import refresh_genre_titles
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Only the JSON Lines format is available without pyarrow
+    pa = pq = None
+
+FORMAT = "mymdb-catalog"
+VERSION = 1
+FORMATS = ("jsonl", "parquet")
+
+# Rows per chunk of the snapshot, and per insert batch when loading it
+CHUNK_SIZE = 500
+
+# Local poster copies aren't part of the snapshot, fetch_posters gets them again
+EXCLUDED_FIELDS = {"poster_file", "poster_thumbnail"}
+
+# Tables in load order, the through table last as it refers to the others
+TABLES = {
+    "genres": Genre,
+    "movies": Movie,
+    "movie_genres": Movie.genres.through,
+}
+
+
+def columns(model):
+    """
+    The fields of a model stored in the snapshot, by column name.
+    """
+    fields = [
+        field
+        for field in model._meta.concrete_fields
+        if field.attname not in EXCLUDED_FIELDS and not (model._meta.auto_created and field.primary_key)
+    ]
+    return {field.attname: field for field in fields}
+
+
+def encode(value):
+    if isinstance(value, uuid.UUID):
+        return value.hex
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+
+def arrow_type(field):
+    field = getattr(field, "target_field", field)
+    internal_type = field.get_internal_type()
+    if internal_type in ("IntegerField", "BigIntegerField", "PositiveIntegerField", "PositiveSmallIntegerField"):
+        return pa.int64()
+    if internal_type == "FloatField":
+        return pa.float64()
+    if internal_type == "BooleanField":
+        return pa.bool_()
+    # UUIDs and datetimes are stored as text, like in the JSON Lines format
+    return pa.string()
+
+
+def chunks(model, size=CHUNK_SIZE):
+    """
+    Yield the rows of a model as dicts of columns, size rows at a time.
+    """
+    names = list(columns(model))
+    rows = []
+    for row in model.objects.order_by("pk").values_list(*names).iterator(chunk_size=size):
+        rows.append(row)
+        if len(rows) == size:
+            yield dict(zip(names, ([encode(value) for value in column] for column in zip(*rows))))
+            rows = []
+    if rows:
+        yield dict(zip(names, ([encode(value) for value in column] for column in zip(*rows))))
+
+
+def remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.remove(path)
+
+
+@contextmanager
+def atomic_path(path, directory=False):
+    """
+    Write to a temporary path moved over path once complete.
+
+    An existing path is only replaced by a snapshot of the same kind, a
+    file or a directory holding an earlier snapshot; that is checked
+    before anything gets written.
+    """
+    if os.path.exists(path) and (
+        os.path.isdir(path) != directory
+        or directory and os.listdir(path) and not os.path.exists(os.path.join(path, "header.json"))
+    ):
+        raise FileExistsError(f'"{path}" already exists and is not a snapshot')
+
+    tmp, old = f"{path}.tmp", f"{path}.old"
+    # Left behind by a run that was killed
+    remove(tmp)
+    try:
+        yield tmp
+        if directory and os.path.exists(path):
+            # A directory can't be replaced in one step
+            remove(old)
+            os.replace(path, old)
+            os.replace(tmp, path)
+            remove(old)
+        else:
+            os.replace(tmp, path)
+    except BaseException:
+        remove(tmp)
+        if os.path.exists(old) and not os.path.exists(path):
+            os.replace(old, path)
+        raise
+
+
+def header():
+    return {"format": FORMAT, "version": VERSION, "exported_at": timezone.now().isoformat()}
+
+
+def check_header(data):
+    if data.get("format") != FORMAT:
+        raise ValueError("Not a catalog snapshot")
+    if data.get("version") != VERSION:
+        raise ValueError(f"Unsupported snapshot version {data.get('version')}")
+
+
+def export_jsonl(path):
+    """
+    Write the catalog as gzipped JSON Lines: a header, then one line per
+    chunk of a table with a list of values for every column.
+    """
+    counts = {}
+    with atomic_path(path) as tmp, gzip.open(tmp, "wt", encoding="utf-8") as f:
+        f.write(json.dumps(header()) + "\n")
+        for table, model in TABLES.items():
+            counts[table] = 0
+            for chunk in chunks(model):
+                f.write(json.dumps({"table": table, "columns": chunk}, separators=(",", ":")) + "\n")
+                counts[table] += len(next(iter(chunk.values())))
+    return counts
+
+
+def export_parquet(path):
+    """
+    Write the catalog as a directory with a Parquet file per table.
+    """
+    if pa is None:
+        raise RuntimeError("pyarrow is required for the Parquet format")
+
+    counts = {}
+    with atomic_path(path, directory=True) as tmp:
+        os.makedirs(tmp)
+        with open(os.path.join(tmp, "header.json"), "w") as f:
+            json.dump(header(), f)
+        for table, model in TABLES.items():
+            schema = pa.schema([(name, arrow_type(field)) for name, field in columns(model).items()])
+            counts[table] = 0
+            with pq.ParquetWriter(os.path.join(tmp, f"{table}.parquet"), schema, compression="zstd") as writer:
+                for chunk in chunks(model):
+                    writer.write_table(pa.Table.from_pydict(chunk, schema=schema))
+                    counts[table] += len(next(iter(chunk.values())))
+    return counts
+
+
+def export(path, format="jsonl"):
+    """
+    Write a snapshot of the catalog to path and return the number of rows
+    of every table.
+    """
+    if format == "parquet":
+        return export_parquet(path)
+    return export_jsonl(path)
+
+
+def read_jsonl(path):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        check_header(json.loads(f.readline()))
+        for line in f:
+            data = json.loads(line)
+            yield data["table"], data["columns"]
+
+
+def read_parquet(path):
+    if pa is None:
+        raise RuntimeError("pyarrow is required for the Parquet format")
+    with open(os.path.join(path, "header.json")) as f:
+        check_header(json.load(f))
+    for table in TABLES:
+        parquet = pq.ParquetFile(os.path.join(path, f"{table}.parquet"))
+        for batch in parquet.iter_batches(batch_size=CHUNK_SIZE):
+            yield table, batch.to_pydict()
+
+
+@contextmanager
+def kept_timestamps():
+    """
+    Keep the created_at and updated_at values of the snapshot; bulk_create
+    would otherwise set them to now.
+    """
+    fields = [
+        field
+        for model in (Genre, Movie)
+        for field in model._meta.concrete_fields
+        if isinstance(field, models.DateTimeField) and (field.auto_now or field.auto_now_add)
+    ]
+    flags = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, flags):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Loader:
+    """
+    Load snapshot chunks into the database with batched inserts.
+
+    Rows of movies and genres that already exist (by IMDb ID or title) are
+    kept as they are, and the links of the snapshot point to them.
+    """
+
+    def __init__(self):
+        self.genre_ids = {}
+        self.movie_ids = {}
+        # Movies that existed before the load, whose genre titles may change
+        self.existing = set()
+
+    def instances(self, model, chunk):
+        fields = {name: field for name, field in columns(model).items() if name in chunk}
+        count = len(next(iter(chunk.values()), []))
+        return [
+            model(**{name: field.to_python(chunk[name][i]) for name, field in fields.items()}) for i in range(count)
+        ]
+
+    def load(self, table, chunk):
+        model = TABLES[table]
+        objs = self.instances(model, chunk)
+        if table == "genres":
+            model.objects.bulk_create(objs, ignore_conflicts=True)
+            ids = dict(Genre.objects.filter(title__in=[genre.title for genre in objs]).values_list("title", "pk"))
+            self.genre_ids.update((genre.pk, ids[genre.title]) for genre in objs)
+        elif table == "movies":
+            movies = Movie.objects.filter(imdb_id__in=[movie.imdb_id for movie in objs])
+            self.existing.update(movies.values_list("pk", flat=True))
+            model.objects.bulk_create(objs, ignore_conflicts=True)
+            ids = dict(movies.values_list("imdb_id", "pk"))
+            self.movie_ids.update((movie.pk, ids[movie.imdb_id]) for movie in objs)
+        else:
+            links = [
+                model(movie_id=self.movie_ids[link.movie_id], genre_id=self.genre_ids[link.genre_id])
+                for link in objs
+                if link.movie_id in self.movie_ids and link.genre_id in self.genre_ids
+            ]
+            model.objects.bulk_create(links, ignore_conflicts=True)
+            refresh_genre_titles(link.movie_id for link in links if link.movie_id in self.existing)
+
+
+def load(path):
+    """
+    Load a snapshot (a gzipped JSON Lines file or a Parquet directory) into
+    the catalog and return the number of rows added to every table.
+    """
+    reader = read_parquet if os.path.isdir(path) else read_jsonl
+    loader = Loader()
+    with serialized_write(), kept_timestamps():
+        before = {table: model.objects.count() for table, model in TABLES.items()}
+        for table, chunk in reader(path):
+            if table in TABLES:
+                loader.load(table, chunk)
+        # Bulk inserts don't send the signals that invalidate the cache
+        invalidate()
+        rebuild_stats()
+        return {table: model.objects.count() - before[table] for table, model in TABLES.items()}
@@ -0,0 +1,238 @@
+from collections import defaultdict
+
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from mymdb.db import serialized_write
+
+from .models import GenreStats, Movie, YearStats
+
+# Movie fields the stats depend on
+STATS_FIELDS = ("year", "on_watchlist", "in_store", "runtime", "imdb_rating", "metascore")
+# Summed values of LibraryStats, in the order of contribution()
+MEASURES = (
+    "movies",
+    "runtime_sum",
+    "runtime_count",
+    "rating_sum",
+    "rating_count",
+    "metascore_sum",
+    "metascore_count",
+)
+KEYS = {YearStats: ("year", "on_watchlist", "in_store"), GenreStats: ("genre_id", "on_watchlist", "in_store")}
+
+# Rows of movie IDs per query, below the SQLite variable limit
+BATCH_SIZE = 500
+
+
+def known(value):
+    # Imports store -1 for the values no source has
+    return value is not None and value >= 0
+
+
+def contribution(row):
+    """
+    What a movie adds to the MEASURES of its groups.
+    """
+    runtime, rating, metascore = row["runtime"], row["imdb_rating"], row["metascore"]
+    return (
+        1,
+        runtime if known(runtime) else 0,
+        int(known(runtime)),
+        rating if known(rating) else 0,
+        int(known(rating)),
+        metascore if known(metascore) else 0,
+        int(known(metascore)),
+    )
+
+
+def stats_row(movie):
+    return {field: getattr(movie, field) for field in STATS_FIELDS}
+
+
+def movie_genre_ids(movie_ids):
+    """
+    The genre IDs of every movie.
+    """
+    movie_ids = list(movie_ids)
+    genre_ids = defaultdict(list)
+    for start in range(0, len(movie_ids), BATCH_SIZE):
+        for movie_id, genre_id in Movie.genres.through.objects.filter(
+            movie_id__in=movie_ids[start : start + BATCH_SIZE]
+        ).values_list("movie_id", "genre_id"):
+            genre_ids[movie_id].append(genre_id)
+    return genre_ids
+
+
+class StatsDelta:
+    """
+    Changes to the stats, for bulk writes which send no signals.
+
+    Every change of a movie is recorded with its stats row (the
+    STATS_FIELDS) before and after it; ``save`` then applies the sums to
+    the groups they belong to, so the cost only depends on the changes.
+    """
+
+    def __init__(self):
+        self.deltas = {model: defaultdict(lambda: [0] * len(MEASURES)) for model in KEYS}
+
+    def apply(self, model, keys, row, sign):
+        values = contribution(row)
+        for key in keys:
+            delta = self.deltas[model][key]
+            for i, value in enumerate(values):
+                delta[i] += sign * value
+
+    def add(self, row, genre_ids, sign=1):
+        self.apply(YearStats, [(row["year"], row["on_watchlist"], row["in_store"])], row, sign)
+        self.add_genres(row, genre_ids, sign)
+
+    def add_genres(self, row, genre_ids, sign=1):
+        """
+        Count a movie in genres it was added to, or removed from with a
+        negative sign.
+        """
+        self.apply(GenreStats, [(genre_id, row["on_watchlist"], row["in_store"]) for genre_id in genre_ids], row, sign)
+
+    def remove(self, row, genre_ids):
+        self.add(row, genre_ids, sign=-1)
+
+    def change(self, old, new, genre_ids):
+        if old != new:
+            self.remove(old, genre_ids)
+            self.add(new, genre_ids)
+
+    def save(self):
+        now = timezone.now()
+        with serialized_write():
+            for model, deltas in self.deltas.items():
+                deltas = {key: delta for key, delta in deltas.items() if any(delta)}
+                if not deltas:
+                    continue
+                fields = KEYS[model]
+                model.objects.bulk_create(
+                    [model(**dict(zip(fields, key))) for key in deltas], ignore_conflicts=True
+                )
+                for key, delta in deltas.items():
+                    model.objects.filter(**dict(zip(fields, key))).update(
+                        **{measure: F(measure) + value for measure, value in zip(MEASURES, delta) if value},
+                        updated_at=now,
+                    )
+        self.deltas = {model: defaultdict(lambda: [0] * len(MEASURES)) for model in KEYS}
+
+
+def update(queryset, **values):
+    """
+    Run ``queryset.update(**values)``, keeping the stats of the movies it
+    changes up to date, and return the number of updated movies.
+    """
+    changes = {field: value for field, value in values.items() if field in STATS_FIELDS}
+    with serialized_write():
+        rows = {}
+        if changes:
+            rows = {row.pop("pk"): row for row in queryset.exclude(**changes).values("pk", *STATS_FIELDS)}
+        count = queryset.update(**values)
+        genre_ids = movie_genre_ids(rows)
+        delta = StatsDelta()
+        for pk, row in rows.items():
+            delta.change(row, {**row, **changes}, genre_ids[pk])
+        delta.save()
+    return count
+
+
+def aggregates(prefix=""):
+    """
+    Aggregations of the MEASURES over movies, through prefix.
+    """
+    runtime, rating, metascore = f"{prefix}runtime", f"{prefix}imdb_rating", f"{prefix}metascore"
+    return {
+        "movies": Count("pk"),
+        "runtime_sum": Sum(runtime, filter=Q(**{f"{runtime}__gte": 0})),
+        "runtime_count": Count("pk", filter=Q(**{f"{runtime}__gte": 0})),
+        "rating_sum": Sum(rating, filter=Q(**{f"{rating}__gte": 0})),
+        "rating_count": Count("pk", filter=Q(**{f"{rating}__gte": 0})),
+        "metascore_sum": Sum(metascore, filter=Q(**{f"{metascore}__gte": 0})),
+        "metascore_count": Count("pk", filter=Q(**{f"{metascore}__gte": 0})),
+    }
+
+
+def rebuild():
+    """
+    Recompute the stats from every movie.
+    """
+    years = Movie.objects.values("year", "on_watchlist", "in_store").annotate(**aggregates())
+    genres = (
+        Movie.genres.through.objects.values("genre_id", "movie__on_watchlist", "movie__in_store")
+        .annotate(**aggregates("movie__"))
+        .order_by()
+    )
+
+    with serialized_write():
+        YearStats.objects.all().delete()
+        GenreStats.objects.all().delete()
+        YearStats.objects.bulk_create(
+            [YearStats(**{**row, **{m: row[m] or 0 for m in MEASURES}}) for row in years.order_by()]
+        )
+        GenreStats.objects.bulk_create(
+            [
+                GenreStats(
+                    genre_id=row["genre_id"],
+                    on_watchlist=row["movie__on_watchlist"],
+                    in_store=row["movie__in_store"],
+                    **{m: row[m] or 0 for m in MEASURES},
+                )
+                for row in genres
+            ]
+        )
+
+
+def averages(row):
+    """
+    Hours of runtime and average rating and metascore of summed MEASURES.
+    """
+    return {
+        "movies": row["movies"],
+        "hours": round(row["runtime_sum"] / 60),
+        "rating": round(row["rating_sum"] / row["rating_count"], 1) if row["rating_count"] else None,
+        "metascore": round(row["metascore_sum"] / row["metascore_count"]) if row["metascore_count"] else None,
+    }
+
+
+def dashboard():
+    """
+    Library statistics read from the summary tables only, so their cost
+    depends on the number of years and genres, not of movies.
+    """
+    flags = defaultdict(lambda: dict.fromkeys(MEASURES, 0))
+    years = defaultdict(lambda: {"movies": 0, "in_store": 0, "wanted": 0})
+    for row in YearStats.objects.filter(movies__gt=0).values("year", "on_watchlist", "in_store", *MEASURES):
+        for measure in MEASURES:
+            flags[row["on_watchlist"], row["in_store"]][measure] += row[measure]
+        year = years[row["year"]]
+        year["movies"] += row["movies"]
+        if row["in_store"]:
+            year["in_store"] += row["movies"]
+        elif row["on_watchlist"]:
+            year["wanted"] += row["movies"]
+
+    genres = defaultdict(lambda: {"all": dict.fromkeys(MEASURES, 0), "to_watch": dict.fromkeys(MEASURES, 0)})
+    for row in GenreStats.objects.filter(movies__gt=0).values("genre__title", "on_watchlist", "in_store", *MEASURES):
+        genre = genres[row["genre__title"]]
+        for measure in MEASURES:
+            genre["all"][measure] += row[measure]
+            if row["on_watchlist"] and row["in_store"]:
+                genre["to_watch"][measure] += row[measure]
+
+    return {
+        "flags": [
+            {"on_watchlist": on_watchlist, "in_store": in_store, **averages(flags[on_watchlist, in_store])}
+            for on_watchlist in (True, False)
+            for in_store in (True, False)
+        ],
+        "to_watch": averages(flags[True, True]),
+        "genres": [
+            {"title": title, **averages(genre["all"]), "to_watch_hours": round(genre["to_watch"]["runtime_sum"] / 60)}
+            for title, genre in sorted(genres.items())
+        ],
+        "years": [{"year": year, **counts} for year, counts in sorted(years.items(), reverse=True)],
+    }
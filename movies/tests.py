@@ -1,3 +1,637 @@
-from django.test import TestCase
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 
-# Create your tests here.
+import requests
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import names, recommend, scanner, stats, watchlist
+from .benchmark import FakeBackend
+from .caching import MOVIES, versions
+from .fetch import FetchEngine
+from .ingest import MovieWriter, complete
+from .jobs import ImportQueue
+from .models import Genre, GenreStats, ImportItem, Movie, Pick, Recommendation, StoreEntry, YearStats
+from .providers import Provider, SharedProvider
+
+GENRES = ("Action", "Comedy", "Crime", "Drama", "Horror", "Romance", "Sci-Fi", "Thriller")
+
+# Keep the tests away from the cache of the development server
+TEST_CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+# Modules a run of the commands with nothing to do must not import
+HEAVY_MODULES = ("PIL", "imdb", "numpy", "requests")
+
+NOOP_UPDATE_STORE = """
+import sys, tempfile, django
+django.setup()
+from django.core.management import call_command
+from django.db import connection
+connection.creation.create_test_db(verbosity=0)
+with tempfile.TemporaryDirectory() as path:
+    call_command("update_store", path, no_cache=True, verbosity=0)
+print(" ".join(sys.modules))
+"""
+
+
+def seed_movies(count):
+    with MovieWriter() as writer:
+        for i in range(count):
+            writer.add(
+                complete(
+                    {
+                        "imdb_id": f"tt{i:07d}",
+                        "title": f"Movie {i}",
+                        "year": 1950 + i % 70,
+                        "runtime": 80 + i % 90,
+                        "awards": "Won an award. " * 50,
+                        "imdb_rating": (i % 100) / 10,
+                        "metascore": float(i % 100),
+                        "genres": [GENRES[i % len(GENRES)], GENRES[(i * 7) % len(GENRES)]],
+                        "on_watchlist": i % 3 == 0,
+                        "in_store": i % 2 == 0,
+                    }
+                )
+            )
+
+
+@override_settings(CACHES=TEST_CACHES)
+class MovieAdminQueryBudgetTest(TestCase):
+    """
+    The admin must run a fixed number of queries whatever the library size.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_movies(3000)
+        cls.user = get_user_model().objects.create_superuser("admin", "admin@example.com", "admin")
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def assertQueryBudget(self, budget, url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        # Django 4.0 wraps the change form in a transaction, its savepoints are free
+        sql = [query["sql"] for query in queries.captured_queries if "SAVEPOINT" not in query["sql"]]
+        self.assertLessEqual(len(sql), budget, "\n".join(sql))
+        return response
+
+    def test_changelist(self):
+        response = self.assertQueryBudget(6, reverse("admin:movies_movie_changelist"))
+        self.assertContains(response, "Movie 99")
+
+    def test_changelist_filtered(self):
+        genre = Movie.objects.first().genres.first()
+        self.assertQueryBudget(
+            6,
+            reverse("admin:movies_movie_changelist"),
+            {"in_store__exact": "1", "on_watchlist__exact": "0", "genres__id__exact": genre.pk},
+        )
+
+    def test_changelist_defers_awards(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse("admin:movies_movie_changelist"))
+        self.assertNotIn('"awards"', queries.captured_queries[-1]["sql"])
+
+    def test_search(self):
+        response = self.assertQueryBudget(6, reverse("admin:movies_movie_changelist"), {"q": "Movie 12"})
+        self.assertContains(response, "Movie 1234")
+
+    def test_change_form(self):
+        movie = Movie.objects.get(imdb_id="tt0000042")
+        self.assertQueryBudget(6, reverse("admin:movies_movie_change", args=(movie.pk,)))
+
+    def test_stats_dashboard(self):
+        response = self.assertQueryBudget(6, reverse("admin:movies_movie_stats"))
+        self.assertContains(response, "Sci-Fi")
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CatalogApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_movies(250)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_keyset_pagination(self):
+        seen, cursor = [], None
+        while True:
+            params = {"limit": 100, **({"cursor": cursor} if cursor else {})}
+            data = self.client.get(reverse("movies:list"), params).json()
+            seen += [(movie["imdb_rating"], movie["imdb_id"]) for movie in data["results"]]
+            cursor = data["next"]
+            if cursor is None:
+                break
+        self.assertEqual(len({imdb_id for _, imdb_id in seen}), 250)
+        ratings = [rating for rating, _ in seen]
+        self.assertEqual(ratings, sorted(ratings, reverse=True))
+
+    def test_filters(self):
+        data = self.client.get(
+            reverse("movies:list"), {"in_store": "true", "min_rating": 9, "genre": "Action", "limit": 100}
+        ).json()
+        self.assertTrue(data["results"])
+        for movie in data["results"]:
+            self.assertTrue(movie["in_store"])
+            self.assertGreaterEqual(movie["imdb_rating"], 9)
+            self.assertIn("Action", movie["genres"])
+
+    def test_bad_parameters(self):
+        self.assertEqual(self.client.get(reverse("movies:list"), {"cursor": "nope"}).status_code, 400)
+        self.assertEqual(self.client.get(reverse("movies:list"), {"year": "soon"}).status_code, 400)
+
+    def test_conditional_requests(self):
+        for url in (
+            reverse("movies:list"),
+            reverse("movies:detail", args=("tt0000042",)),
+            reverse("movies:genres"),
+        ):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"]).status_code, 304)
+            self.assertEqual(
+                self.client.get(url, HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]).status_code, 304
+            )
+
+    def test_changes_invalidate_etag(self):
+        url = reverse("movies:list")
+        etag = self.client.get(url)["ETag"]
+        movie = Movie.objects.get(imdb_id="tt0000042")
+        movie.imdb_rating = 10
+        with self.captureOnCommitCallbacks(execute=True):
+            movie.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_genre_changes_invalidate_etag(self):
+        urls = (reverse("movies:list"), reverse("movies:detail", args=("tt0000042",)))
+        etags = [self.client.get(url)["ETag"] for url in urls]
+        genre = Movie.objects.get(imdb_id="tt0000042").genres.first()
+        genre.title = "Renamed"
+        with self.captureOnCommitCallbacks(execute=True):
+            genre.save()
+        for url, etag in zip(urls, etags):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_admin_action_invalidates_etag(self):
+        movie = Movie.objects.filter(in_store=False).first()
+        urls = (reverse("movies:list"), reverse("movies:detail", args=(movie.imdb_id,)))
+        etags = [self.client.get(url)["ETag"] for url in urls]
+        self.client.force_login(get_user_model().objects.create_superuser("admin", "admin@example.com", "admin"))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                reverse("admin:movies_movie_changelist"), {"action": "set_in_store", "_selected_action": [movie.pk]}
+            )
+        for url, etag in zip(urls, etags):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_cached_until_import(self):
+        url = reverse("movies:list")
+        for _ in range(2):
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(url)
+                self.client.get(reverse("movies:genres"))
+        self.assertEqual(len(queries), 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            with MovieWriter() as writer:
+                writer.add(complete({"imdb_id": "tt9999999", "title": "New", "year": 2022, "imdb_rating": 10}))
+        self.assertEqual(self.client.get(url).json()["results"][0]["imdb_id"], "tt9999999")
+
+
+@override_settings(CACHES=TEST_CACHES)
+class SearchApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_movies(250)
+        with MovieWriter() as writer:
+            for i, title in enumerate(("Up", "Upgrade", "It", "Pi")):
+                writer.add(complete({"imdb_id": f"tt999999{i}", "title": title, "year": 2009}))
+
+    def search(self, query):
+        response = self.client.get(reverse("movies:search"), {"q": query})
+        self.assertEqual(response.status_code, 200)
+        return [movie["title"] for movie in response.json()["results"]]
+
+    def test_words(self):
+        self.assertEqual(self.search("Movie 123")[0], "Movie 123")
+        self.assertEqual(self.search("movei 123")[0], "Movie 123")
+
+    def test_short_words(self):
+        self.assertEqual(self.search("up"), ["Up", "Upgrade"])
+        self.assertEqual(self.search("Pi")[0], "Pi")
+        self.assertEqual(self.search("Movie 4")[0], "Movie 4")
+        self.assertEqual(self.search("%"), [])
+        self.assertEqual(self.search(""), [])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RecommendationTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_movies(300)
+
+    def test_incremental_build_matches_full(self):
+        self.assertEqual(recommend.build(), 300)
+        movie = Movie.objects.get(imdb_id="tt0000042")
+        self.assertEqual(movie.recommendations.count(), recommend.NEIGHBORS)
+        self.assertTrue(all(rec.similar.in_store for rec in movie.recommendations.select_related("similar")))
+        self.assertEqual(Pick.objects.count(), Movie.objects.filter(in_store=True).count())
+
+        with MovieWriter() as writer:
+            writer.add(
+                complete(
+                    {
+                        "imdb_id": "tt9999999",
+                        "title": "New",
+                        "year": 2022,
+                        "imdb_rating": 10,
+                        "metascore": 100,
+                        "genres": list(GENRES[:2]),
+                        "in_store": True,
+                    }
+                )
+            )
+        self.assertLess(recommend.build(), 300)
+        incremental = set(Recommendation.objects.values_list("movie_id", "similar_id", "rank"))
+        recommend.build(full=True)
+        self.assertEqual(set(Recommendation.objects.values_list("movie_id", "similar_id", "rank")), incremental)
+
+    def test_api(self):
+        recommend.build()
+        data = self.client.get(reverse("movies:similar", args=("tt0000042",))).json()
+        self.assertEqual(len(data["results"]), recommend.NEIGHBORS)
+        scores = [movie["score"] for movie in data["results"]]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+        data = self.client.get(reverse("movies:picks"), {"on_watchlist": "true", "limit": 5}).json()
+        self.assertEqual(len(data["results"]), 5)
+        self.assertTrue(all(movie["on_watchlist"] and movie["in_store"] for movie in data["results"]))
+
+
+class SharedProviderTest(TestCase):
+    def test_duplicates_share_one_fetch(self):
+        calls = []
+        lock = threading.Lock()
+
+        class SlowProvider(Provider):
+            def lookup(self, query, year=None):
+                with lock:
+                    calls.append(("lookup", query))
+                time.sleep(0.05)
+                return complete({"imdb_id": "tt0000001", "title": "Heat", "year": year})
+
+            def get(self, imdb_id):
+                with lock:
+                    calls.append(("get", imdb_id))
+                return complete({"imdb_id": imdb_id, "title": "Heat", "year": 1995})
+
+        engine = FetchEngine(concurrency=8, rps=0)
+        provider = SharedProvider(SlowProvider(engine, cache=None))
+        queries = ["Heat", "heat", "HEAT!", "Heat"] * 4
+        results = [future.result() for _, future in engine.map(lambda query: provider.lookup(query, 1995), queries)]
+
+        self.assertEqual([call for call, _ in calls], ["lookup"])
+        self.assertTrue(all(record["imdb_id"] == "tt0000001" for record in results))
+        self.assertEqual(provider.get("tt0000001")["title"], "Heat")
+        self.assertEqual(len(calls), 1)
+        # Every lookup but the first, and the get
+        self.assertEqual(engine.metrics.shared, len(queries))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CatalogSnapshotTest(TestCase):
+    def test_round_trip(self):
+        seed_movies(1200)
+        movie = Movie.objects.get(imdb_id="tt0000042")
+        links = set(Movie.genres.through.objects.values_list("movie__imdb_id", "genre__title"))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "catalog.jsonl.gz")
+            call_command("export_catalog", path, stdout=open(os.devnull, "w"))
+            Movie.objects.filter(imdb_id__gte="tt0000600").delete()
+            Genre.objects.filter(title="Action").delete()
+            call_command("import_catalog", path, stdout=open(os.devnull, "w"))
+            # Loading it again adds nothing
+            call_command("import_catalog", path, stdout=open(os.devnull, "w"))
+
+        self.assertEqual(Movie.objects.count(), 1200)
+        self.assertEqual(set(Movie.genres.through.objects.values_list("movie__imdb_id", "genre__title")), links)
+        restored = Movie.objects.get(imdb_id="tt0000042")
+        self.assertEqual(
+            (restored.pk, restored.updated_at, restored.awards), (movie.pk, movie.updated_at, movie.awards)
+        )
+        self.assertEqual(restored.genre_titles, movie.genre_titles)
+        self.assertIn("Action", Movie.objects.get(imdb_id="tt0000000").genre_titles)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class UpdateStoreTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.backend = FakeBackend(latency=0)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = tmp.name
+        for i in range(3):
+            self.touch(f"Synthetic.Movie.{i}.{1950 + i}.1080p.BluRay.x264-GROUP.mkv")
+
+    def touch(self, name):
+        open(os.path.join(self.root, name), "wb").close()
+
+    def update_store(self):
+        with self.backend.installed(), self.captureOnCommitCallbacks(execute=True):
+            call_command("update_store", self.root, no_cache=True, no_posters=True, verbosity=0)
+
+    def test_unchanged_store(self):
+        self.update_store()
+        self.assertEqual(Movie.objects.filter(in_store=True).count(), 3)
+        calls, version = self.backend.calls, versions([MOVIES])
+        self.update_store()
+        self.assertEqual(self.backend.calls, calls)
+        self.assertEqual(versions([MOVIES]), version)
+
+    def test_deleted_movie(self):
+        self.update_store()
+        Movie.objects.filter(title="Synthetic Movie 1").delete()
+        calls = self.backend.calls
+        self.update_store()
+        self.assertGreater(self.backend.calls, calls)
+        self.assertTrue(Movie.objects.get(title="Synthetic Movie 1").in_store)
+
+    def test_vanished_entry(self):
+        self.update_store()
+        os.remove(os.path.join(self.root, "Synthetic.Movie.1.1951.1080p.BluRay.x264-GROUP.mkv"))
+        self.update_store()
+        self.assertFalse(Movie.objects.get(title="Synthetic Movie 1").in_store)
+        self.assertEqual(StoreEntry.objects.count(), 2)
+        self.assertEqual(Movie.objects.filter(in_store=True).count(), 2)
+
+
+class ImportTimeTest(SimpleTestCase):
+    """
+    Commands run every few minutes, their startup must stay cheap.
+    """
+
+    def imported(self, *args):
+        """
+        Run Python with args and return its output and the modules it imported.
+        """
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", *args],
+            cwd=settings.BASE_DIR,
+            env={**os.environ, "DJANGO_SETTINGS_MODULE": "mymdb.settings"},
+            capture_output=True,
+            text=True,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr[-2000:])
+        modules = {line.split("|")[2].strip() for line in result.stderr.splitlines() if line.startswith("import time:")}
+        return result.stdout, modules
+
+    def test_help(self):
+        _, modules = self.imported("manage.py", "help")
+        self.assertFalse(modules & set(HEAVY_MODULES))
+
+    def test_noop_update_store(self):
+        stdout, _ = self.imported("-c", NOOP_UPDATE_STORE)
+        self.assertFalse(set(stdout.split()) & set(HEAVY_MODULES))
+
+
+@override_settings(CACHES=TEST_CACHES)
+class LibraryStatsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_movies(200)
+
+    def snapshot(self):
+        # Sums of floats drift a little when movies leave a group
+        fields = ("on_watchlist", "in_store", *stats.MEASURES)
+        return tuple(
+            {row[:3]: tuple(round(value, 6) for value in row[3:]) for row in rows}
+            for rows in (
+                YearStats.objects.filter(movies__gt=0).values_list("year", *fields),
+                GenreStats.objects.filter(movies__gt=0).values_list("genre", *fields),
+            )
+        )
+
+    def assertStatsUpToDate(self):
+        incremental = self.snapshot()
+        stats.rebuild()
+        self.assertEqual(incremental, self.snapshot())
+
+    def test_incremental_matches_rebuild(self):
+        self.assertStatsUpToDate()
+
+        with MovieWriter() as writer:
+            writer.add({"imdb_id": "tt0000001", "in_store": True, "on_watchlist": True})
+            writer.add(complete({"imdb_id": "tt9999999", "title": "New", "year": 2022, "genres": ["Western"]}))
+        stats.update(Movie.objects.filter(year=1960), in_store=False, on_watchlist=True)
+        self.client.force_login(get_user_model().objects.create_superuser("admin", "admin@example.com", "admin"))
+        selected = list(Movie.objects.filter(year=1961).values_list("pk", flat=True))
+        self.client.post(
+            reverse("admin:movies_movie_changelist"), {"action": "set_in_store", "_selected_action": selected}
+        )
+        self.assertFalse(Movie.objects.filter(year=1961, in_store=False).exists())
+
+        movie = Movie.objects.get(imdb_id="tt0000042")
+        movie.imdb_rating, movie.runtime = 9.9, -1
+        movie.save()
+        movie.genres.add(Genre.objects.get(title="Western"))
+        movie.genres.remove(movie.genres.exclude(title="Western").first())
+        Genre.objects.get(title="Action").movies.add(movie)
+        Genre.objects.get(title="Comedy").movies.clear()
+        Movie.objects.filter(year=1962).delete()
+        self.assertStatsUpToDate()
+
+
+class WatchlistParserTest(SimpleTestCase):
+    ITEMS = [{"const": "tt0000001", "title": 'A "quoted" [title]'}, {"const": "tt0000002"}, "tt0000003"]
+
+    def parse(self, text, size):
+        return list(watchlist.iter_json_items(text[i : i + size] for i in range(0, len(text), size)))
+
+    def test_chunk_boundaries(self):
+        payload = json.dumps({"id": "ls1", "list": {"name": "items", "items": self.ITEMS}, "total": 3})
+        for text in (payload, f"IMDbReactInitialState.push({payload});", json.dumps(self.ITEMS)):
+            for size in (1, 2, 3, 7, len(text)):
+                self.assertEqual(self.parse(text, size), self.ITEMS, (text, size))
+
+    def test_empty_and_missing(self):
+        self.assertEqual(self.parse(' { "list" : { "items" : [ ] } } ', 4), [])
+        self.assertEqual(self.parse("[]", 1), [])
+        with self.assertRaises(watchlist.ItemsNotFound):
+            self.parse('{"items": ["tt0000001"]}', 5)
+        with self.assertRaises(watchlist.ItemsNotFound):
+            self.parse('["tt0000001", ', 5)
+
+    def test_pages(self):
+        class Engine:
+            def __init__(self, pages):
+                self.pages, self.urls = pages, []
+
+            def get(self, url, stream=False):
+                self.urls.append(url)
+                page = int(url.rsplit("=", 1)[1])
+                resp = requests.Response()
+                resp.url, resp.encoding = url, "utf-8"
+                resp.status_code = 200 if page <= len(self.pages) else 404
+                resp.raw = io.BytesIO(json.dumps(self.pages[page - 1]).encode() if resp.status_code == 200 else b"")
+                return resp
+
+        url = "https://example.com/watchlist?page={page}"
+        for pages in ([["tt0000001", "tt0000002"], ["tt0000003"]], [["tt0000001", "tt0000002"], ["tt0000003"], []]):
+            engine = Engine(pages)
+            self.assertEqual(list(watchlist.iter_pages(engine, url)), ["tt0000001", "tt0000002", "tt0000003"])
+            self.assertEqual(len(engine.urls), 3)
+        with self.assertRaises(requests.HTTPError):
+            list(watchlist.iter_pages(Engine([]), url))
+
+
+class NameParsingTest(SimpleTestCase):
+    def test_parse_name(self):
+        for name, expected in (
+            ("The.Matrix.1999.1080p.BluRay.x264-GROUP.mkv", ("The Matrix", 1999)),
+            ("[Group] Alien (1979) [1080p].mkv", ("Alien", 1979)),
+            ("Blade Runner 2049 (2017)", ("Blade Runner 2049", 2017)),
+            ("1917.2019.2160p.mkv", ("1917", 2019)),
+            ("2012 (2009).avi", ("2012", 2009)),
+            ("Amelie.2001.EXTENDED.1080p.mkv", ("Amelie", 2001)),
+            ("Charlotte's Web.mkv", ("Charlotte's Web", None)),
+            ("Some.Movie.WEB.1080p.mkv", ("Some Movie", None)),
+            ("Heat.cd2.avi", ("Heat", None)),
+            ("Heat (1995) CD1", ("Heat", 1995)),
+            ("Alien", ("Alien", None)),
+        ):
+            self.assertEqual(names.parse_name(name), expected, name)
+
+    def test_without_part(self):
+        self.assertEqual(names.without_part("Heat.cd2.avi"), "Heat..avi")
+        self.assertEqual(names.without_part("Heat.CD1.avi"), names.without_part("Heat.cd2.avi"))
+        self.assertEqual(names.without_part("Heat Part3"), "Heat ")
+        self.assertIsNone(names.without_part("Heat.avi"))
+        self.assertIsNone(names.without_part("Discovery.2009.mkv"))
+
+    def test_title_index(self):
+        index = names.TitleIndex(
+            [("The Matrix", 1999, "tt1"), ("Amélie", 2001, "tt2"), ("Heat", 1986, "tt3"), ("Heat", 1995, "tt4")]
+        )
+        self.assertEqual(index.match("matrix", 1999), "tt1")
+        self.assertEqual(index.match("Amelie"), "tt2")
+        # Release years are one year off between countries
+        self.assertEqual(index.match("The Matrix", 2000), "tt1")
+        self.assertEqual(index.match("The Matrix", 1998), "tt1")
+        self.assertIsNone(index.match("The Matrix", 2001))
+        self.assertEqual(index.match("Heat", 1995), "tt4")
+        self.assertEqual(index.match("Heat", 1985), "tt3")
+        # Without a year, an ambiguous title is left to the remote search
+        self.assertIsNone(index.match("Heat"))
+        self.assertIsNone(index.match("Up"))
+
+
+class ScannerTest(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = tmp.name
+        for path in (
+            "Matrix.1999.iso",
+            "Collection/Amelie.2001.mkv",
+            "Collection/Brazil.1985.mkv",
+            "Collection/Brazil.1985.sample.mkv",
+            "Collection/Heat.1995.cd1.avi",
+            "Collection/Heat.1995.cd2.avi",
+            "Collection/notes.txt",
+            "Alien (1979)/Alien.mkv",
+            "Alien (1979)/Sample/alien-sample.mkv",
+            "Ran (1985)/VIDEO_TS/VTS_01_1.VOB",
+            "Ran (1985)/VIDEO_TS/VTS_01_2.VOB",
+            "Akira (1988)/BDMV/STREAM/00000.m2ts",
+            "Kagemusha (1980)/CD1/Kagemusha.avi",
+            "Kagemusha (1980)/CD2/Kagemusha.avi",
+            ".hidden/Secret.mkv",
+            "Deep/1/2/3/Deep.mkv",
+        ):
+            path = os.path.join(self.root, path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, "wb").close()
+
+    def test_walk(self):
+        missing = os.path.join(self.root, "missing")
+        walker = scanner.Scanner([self.root, missing], max_depth=3)
+        with self.assertLogs("movies.scanner", "ERROR"):
+            found = sorted((root, name) for root, name, _ in walker)
+        self.assertEqual(
+            found,
+            [
+                (self.root, name)
+                for name in (
+                    "Akira (1988)",
+                    "Alien (1979)",
+                    "Collection/Amelie.2001.mkv",
+                    "Collection/Brazil.1985.mkv",
+                    "Collection/Heat.1995.cd1.avi",
+                    "Kagemusha (1980)",
+                    "Matrix.1999.iso",
+                    "Ran (1985)",
+                )
+            ],
+        )
+        self.assertEqual(walker.failed, {missing})
+
+    def test_signatures(self):
+        signatures = {name: signature for _, name, signature in scanner.Scanner([self.root])}
+        disc = os.stat(os.path.join(self.root, "Ran (1985)", "VIDEO_TS"))
+        self.assertEqual(signatures["Ran (1985)"], (disc.st_ino, disc.st_mtime, disc.st_size))
+        part = os.stat(os.path.join(self.root, "Kagemusha (1980)", "CD1"))
+        self.assertEqual(signatures["Kagemusha (1980)"][0], part.st_ino)
+
+
+class ImportQueueTest(TestCase):
+    KEYS = ["a", "b", "c", "d"]
+
+    def setUp(self):
+        queue = ImportQueue("test")
+        self.assertEqual(list(queue.filter(self.KEYS)), self.KEYS)
+        queue.fetched("a", "tt0000001")
+        queue.written(["tt0000001"])
+        queue.failed("b", Exception("Service Unavailable"))
+        queue.fetched("c", "tt0000003")
+        queue.flush()
+
+    def test_filter(self):
+        keys = self.KEYS + ["e"]
+        queue = ImportQueue("test", resume=True)
+        self.assertEqual(list(queue.filter(keys)), ["c", "d", "e"])
+        self.assertEqual(queue.skipped, {"a": "tt0000001"})
+        self.assertEqual(list(ImportQueue("test", retry_failed=True).filter(keys)), ["b"])
+        self.assertEqual(list(ImportQueue("test", resume=True, retry_failed=True).filter(keys)), ["b", "c", "d", "e"])
+        # A fresh import forgets the last one
+        self.assertEqual(list(ImportQueue("test").filter(keys)), keys)
+        self.assertFalse(ImportItem.objects.filter(command="test").exists())
+
+    def test_missing(self):
+        queue = ImportQueue("test", resume=True)
+        list(queue.filter(self.KEYS))
+        queue.fetched("d", "tt0000004")
+        queue.missing(["tt0000004"])
+        queue.flush()
+        item = ImportItem.objects.get(command="test", key="d")
+        self.assertEqual(item.state, ImportItem.State.FAILED)
+        self.assertEqual(item.error, "tt0000004 was deleted before it was written")
+        self.assertEqual(list(ImportQueue("test", retry_failed=True).filter(self.KEYS)), ["b", "d"])
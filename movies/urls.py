@@ -0,0 +1,14 @@
+from django.urls import path
+
+from . import views
+
+app_name = "movies"
+
+urlpatterns = [
+    path("movies", views.list_movies, name="list"),
+    path("movies/search", views.search_movies, name="search"),
+    path("movies/<str:imdb_id>", views.movie_detail, name="detail"),
+    path("movies/<str:imdb_id>/similar", views.similar_movies, name="similar"),
+    path("genres", views.list_genres, name="genres"),
+    path("picks", views.top_picks, name="picks"),
+]
@@ -1,3 +1,306 @@
-from django.shortcuts import render
+import base64
+import binascii
+import hashlib
+import json
+import os
+import uuid
 
-# Create your views here.
+from django.conf import settings
+from django.db.models import Count, Max, Q
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.http import urlencode
+from django.views.decorators.http import condition, require_GET
+from django.views.static import serve
+
+from . import search
+from .caching import NAMESPACES, cached, versions
+from .models import Genre, Movie, Pick, Recommendation
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def movie_json(movie):
+    return {
+        "imdb_id": movie.imdb_id,
+        "title": movie.title,
+        "year": movie.year,
+        "runtime": movie.runtime,
+        "language": movie.language,
+        "genres": movie.genre_titles.split(", ") if movie.genre_titles else [],
+        "poster": movie.poster,
+        "imdb_rating": movie.imdb_rating,
+        "metascore": movie.metascore,
+        "on_watchlist": movie.on_watchlist,
+        "in_store": movie.in_store,
+    }
+
+
+class BadRequest(Exception):
+    pass
+
+
+def page_size(request):
+    try:
+        return min(max(int(request.GET.get("limit", PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        raise BadRequest("limit must be an integer")
+
+
+def parse_bool(request, name):
+    value = request.GET.get(name)
+    if value is None:
+        return None
+    if value.lower() in ("1", "true", "yes"):
+        return True
+    if value.lower() in ("0", "false", "no"):
+        return False
+    raise BadRequest(f"{name} must be true or false")
+
+
+def parse_number(request, name, type=float):
+    value = request.GET.get(name)
+    if value is None:
+        return None
+    try:
+        return type(value)
+    except ValueError:
+        raise BadRequest(f"{name} must be a number")
+
+
+def encode_cursor(movie):
+    data = json.dumps([movie.imdb_rating, movie.pk.hex])
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        rating, pk = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return float(rating), uuid.UUID(pk)
+    except (binascii.Error, ValueError, TypeError):
+        raise BadRequest("Invalid cursor")
+
+
+def filtered_movies(request):
+    """
+    The movies matching the filters of the request.
+
+    Movies without a rating (NULL, which imports never write) aren't part
+    of the catalog, as they can't be paginated by rating.
+    """
+    movies = Movie.objects.filter(imdb_rating__isnull=False)
+    if "genre" in request.GET:
+        movies = movies.filter(genres__title=request.GET["genre"])
+    year = parse_number(request, "year", int)
+    if year is not None:
+        movies = movies.filter(year=year)
+    min_rating = parse_number(request, "min_rating")
+    if min_rating is not None:
+        movies = movies.filter(imdb_rating__gte=min_rating)
+    max_rating = parse_number(request, "max_rating")
+    if max_rating is not None:
+        movies = movies.filter(imdb_rating__lte=max_rating)
+    for flag in ("on_watchlist", "in_store"):
+        value = parse_bool(request, flag)
+        if value is not None:
+            movies = movies.filter(**{flag: value})
+    return movies
+
+
+def after_cursor(movies, cursor):
+    """
+    Keep the movies that come after the cursor in (imdb_rating, id)
+    descending order.
+    """
+    rating, pk = decode_cursor(cursor)
+    # The first condition lets SQLite seek the rating index to the cursor
+    return movies.filter(Q(imdb_rating__lte=rating), Q(imdb_rating__lt=rating) | Q(pk__lt=pk))
+
+
+def query_key(request, exclude=()):
+    """
+    The query string of the request in a canonical order, for cache keys.
+    """
+    return urlencode(sorted((k, v) for k, v in request.GET.lists() if k not in exclude), doseq=True)
+
+
+def list_state(request):
+    """
+    Last update and size of the movies matching the request, to validate
+    cached pages; computed once per request.
+    """
+    if not hasattr(request, "_list_state"):
+        try:
+            request._list_state = cached(
+                f"list_state:{query_key(request, exclude=('cursor', 'limit'))}",
+                lambda: filtered_movies(request).aggregate(last_modified=Max("updated_at"), count=Count("pk")),
+            )
+        except BadRequest:
+            request._list_state = {"last_modified": None, "count": None}
+    return request._list_state
+
+
+def list_etag(request):
+    state = list_state(request)
+    if state["last_modified"] is None:
+        return None
+    # Every invalidation changes the versions, even when a write kept updated_at
+    tags = ":".join(str(version) for version in versions(NAMESPACES))
+    key = f"{query_key(request)}:{state['last_modified'].isoformat()}:{state['count']}:{tags}"
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def list_last_modified(request):
+    return list_state(request)["last_modified"]
+
+
+@require_GET
+@condition(etag_func=list_etag, last_modified_func=list_last_modified)
+def list_movies(request):
+    """
+    Filter the catalog, best rated first, one keyset page at a time.
+
+    The ``next`` cursor of a page fetches the following one; it stays valid
+    however deep the page is, as it isn't an offset.
+    """
+    try:
+        limit = page_size(request)
+        movies = filtered_movies(request)
+        if request.GET.get("cursor"):
+            movies = after_cursor(movies, request.GET["cursor"])
+    except BadRequest as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    def page():
+        movies_page = list(movies.defer("awards").order_by("-imdb_rating", "-pk")[: limit + 1])
+        return {
+            "results": [movie_json(movie) for movie in movies_page[:limit]],
+            "next": encode_cursor(movies_page[limit - 1]) if len(movies_page) > limit else None,
+        }
+
+    return JsonResponse(cached(f"list:{query_key(request)}", page))
+
+
+def get_movie(request, imdb_id):
+    if not hasattr(request, "_movie"):
+        request._movie = get_object_or_404(Movie, imdb_id=imdb_id)
+    return request._movie
+
+
+def movie_etag(request, imdb_id):
+    try:
+        movie = get_movie(request, imdb_id)
+    except Http404:
+        return None
+    return f"{movie.pk.hex}-{movie.updated_at.timestamp()}"
+
+
+def movie_last_modified(request, imdb_id):
+    try:
+        return get_movie(request, imdb_id).updated_at
+    except Http404:
+        return None
+
+
+@require_GET
+@condition(etag_func=movie_etag, last_modified_func=movie_last_modified)
+def movie_detail(request, imdb_id):
+    movie = get_movie(request, imdb_id)
+    return JsonResponse({**movie_json(movie), "awards": movie.awards})
+
+
+def genres_state(request):
+    # Movies count towards their genres, so they invalidate the list too
+    if not hasattr(request, "_genres_state"):
+        request._genres_state = cached(
+            "genres_state",
+            lambda: {
+                **Genre.objects.aggregate(genre_modified=Max("updated_at"), genres=Count("pk")),
+                **Movie.objects.aggregate(movie_modified=Max("updated_at"), movies=Count("pk")),
+            },
+        )
+    return request._genres_state
+
+
+def genres_last_modified(request):
+    state = genres_state(request)
+    return max(filter(None, (state["genre_modified"], state["movie_modified"])), default=None)
+
+
+def genres_etag(request):
+    state = genres_state(request)
+    if state["genre_modified"] is None:
+        return None
+    return hashlib.sha1(json.dumps(state, default=str).encode()).hexdigest()
+
+
+@require_GET
+@condition(etag_func=genres_etag, last_modified_func=genres_last_modified)
+def list_genres(request):
+    def genres():
+        genres = Genre.objects.annotate(movie_count=Count("movies")).order_by("title")
+        return [{"title": title, "movies": count} for title, count in genres.values_list("title", "movie_count")]
+
+    return JsonResponse({"results": cached("genres", genres)})
+
+
+@require_GET
+def similar_movies(request, imdb_id):
+    """
+    The in-store movies most like a movie, from the recommendation index.
+    """
+    movie = get_object_or_404(Movie.objects.only("pk"), imdb_id=imdb_id)
+    recommendations = (
+        Recommendation.objects.filter(movie=movie)
+        .select_related("similar")
+        .defer("similar__awards")
+        .order_by("rank")
+    )
+    return JsonResponse(
+        {"results": [{**movie_json(rec.similar), "score": rec.score} for rec in recommendations]}
+    )
+
+
+@require_GET
+def top_picks(request):
+    """
+    The best in-store movies to watch next, from the recommendation index.
+    """
+    try:
+        limit = page_size(request)
+        on_watchlist = parse_bool(request, "on_watchlist")
+    except BadRequest as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    picks = Pick.objects.select_related("movie").defer("movie__awards").order_by("-score")
+    if on_watchlist is not None:
+        picks = picks.filter(movie__on_watchlist=on_watchlist)
+    return JsonResponse({"results": [{**movie_json(pick.movie), "score": pick.score} for pick in picks[:limit]]})
+
+
+@require_GET
+def search_movies(request):
+    query = request.GET.get("q", "")
+    try:
+        limit = min(max(int(request.GET.get("limit", 20)), 1), 100)
+    except ValueError:
+        return JsonResponse({"error": "limit must be an integer"}, status=400)
+
+    ids = [uuid.UUID(id) for id in search.search(query, limit=limit)]
+    movies = Movie.objects.defer("awards").in_bulk(ids)
+    return JsonResponse({"query": query, "results": [movie_json(movies[id]) for id in ids if id in movies]})
+
+
+@require_GET
+def poster(request, path):
+    """
+    Serve a local poster copy; their paths are content hashes so they never change.
+
+    Only routed with DEBUG, as django.views.static.serve isn't meant for
+    production. There the web server serves MEDIA_ROOT at MEDIA_URL with
+    the same "Cache-Control: public, max-age=31536000, immutable" header.
+    """
+    response = serve(request, path, document_root=os.path.join(settings.MEDIA_ROOT, "posters"))
+    response["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
@@ -0,0 +1,163 @@
+import csv
+import json
+import os
+import re
+from itertools import count
+
+CHUNK_SIZE = 64 * 1024
+
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r"\s*")
+_list_key = re.compile(r'"list"\s*:\s*\{')
+_items_key = re.compile(r'"items"\s*:\s*\[')
+
+
+class ItemsNotFound(Exception):
+    pass
+
+
+def iter_json_items(chunks):
+    """
+    Incrementally parse the items of a watchlist out of text chunks.
+
+    The items are either the ``list.items`` array of an IMDb watchlist
+    payload (optionally wrapped in a JavaScript callback) or a top-level
+    JSON array. Only the item being decoded is kept in memory.
+    """
+    chunks = iter(chunks)
+    buffer = ""
+    # Start of the unconsumed part of the buffer
+    pos = 0
+
+    def more():
+        nonlocal buffer, pos
+        chunk = next(chunks, None)
+        if chunk is None:
+            return False
+        buffer = buffer[pos:] + chunk
+        pos = 0
+        return True
+
+    def find(key):
+        """
+        Consume the buffer up to the end of the first match of key.
+        """
+        nonlocal pos
+        while True:
+            match = key.search(buffer, pos)
+            if match:
+                pos = match.end()
+                return
+            # Keys start with a quote; keep the last two quotes so a key cut
+            # by the end of the chunk can still match
+            last = buffer.rfind('"', pos)
+            if last < 0:
+                pos = len(buffer)
+            else:
+                before = buffer.rfind('"', pos, last)
+                pos = last if before < 0 else before
+            if not more():
+                raise ItemsNotFound("No watchlist items found")
+
+    # Find the opening bracket of the items array
+    while _whitespace.match(buffer, pos).end() == len(buffer):
+        if not more():
+            raise ItemsNotFound("No watchlist items found")
+    pos = _whitespace.match(buffer, pos).end()
+    if buffer[pos] == "[":
+        pos += 1
+    else:
+        find(_list_key)
+        find(_items_key)
+
+    while True:
+        pos = _whitespace.match(buffer, pos).end()
+        if pos == len(buffer):
+            if not more():
+                raise ItemsNotFound("Unterminated watchlist items")
+            continue
+        if buffer[pos] == "]":
+            return
+        if buffer[pos] == ",":
+            pos += 1
+            continue
+        try:
+            item, pos = _decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if not more():
+                raise
+            continue
+        yield item
+
+
+def item_id(item):
+    if isinstance(item, str):
+        return item
+    for key in ("const", "Const", "imdb_id"):
+        if item.get(key):
+            return item[key]
+    return None
+
+
+def iter_response(resp):
+    if resp.encoding is None:
+        resp.encoding = "utf-8"
+    with resp:
+        yield from iter_json_items(resp.iter_content(CHUNK_SIZE, decode_unicode=True))
+
+
+def iter_url(engine, url):
+    resp = engine.get(url, stream=True)
+    resp.raise_for_status()
+    yield from iter_response(resp)
+
+
+def iter_pages(engine, url):
+    """
+    Follow a paginated URL with a "{page}" placeholder until a page is
+    empty or missing.
+    """
+    for page in count(1):
+        resp = engine.get(url.format(page=page), stream=True)
+        if resp.status_code == 404 and page > 1:
+            # Past the last page
+            resp.close()
+            return
+        resp.raise_for_status()
+        items = iter_response(resp)
+        first = next(items, None)
+        if first is None:
+            return
+        yield first
+        yield from items
+
+
+def iter_csv(path):
+    with open(path, newline="", encoding="utf-8") as f:
+        yield from csv.DictReader(f)
+
+
+def iter_json_file(path):
+    with open(path, encoding="utf-8") as f:
+        yield from iter_json_items(iter(lambda: f.read(CHUNK_SIZE), ""))
+
+
+def iter_ids(engine, sources):
+    """
+    Yield the IMDb IDs of every item of the given watchlist sources.
+
+    A source is a URL (a "{page}" placeholder makes it paginated) or the
+    path to an exported CSV or JSON file.
+    """
+    for source in sources:
+        if re.match(r"https?://", source):
+            items = iter_pages(engine, source) if "{page}" in source else iter_url(engine, source)
+        elif os.path.splitext(source)[1].lower() == ".csv":
+            items = iter_csv(source)
+        else:
+            items = iter_json_file(source)
+
+        for item in items:
+            id = item_id(item)
+            if id:
+                yield id
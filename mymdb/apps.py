@@ -0,0 +1,8 @@
+from django.apps import AppConfig
+
+
+class MymdbConfig(AppConfig):
+    name = 'mymdb'
+
+    def ready(self):
+        from . import db  # noqa: F401
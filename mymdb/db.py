@@ -0,0 +1,44 @@
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    """
+    Apply SQLITE_PRAGMAS to every new SQLite connection.
+    """
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {pragma} = {value}")
+
+
+@contextmanager
+def serialized_write(using=DEFAULT_DB_ALIAS):
+    """
+    Run a write transaction holding the SQLite write lock from its start.
+
+    SQLite allows a single writer at a time. A deferred transaction that
+    reads before writing fails with SQLITE_BUSY_SNAPSHOT when another
+    process wrote meanwhile, whatever the busy_timeout; BEGIN IMMEDIATE
+    waits for the other writers first instead, while WAL mode lets readers
+    carry on.
+    """
+    connection = transaction.get_connection(using)
+    if connection.vendor != "sqlite" or connection.in_atomic_block:
+        with transaction.atomic(using=using):
+            yield
+        return
+
+    # Django starts the transaction of the outermost atomic block here
+    connection._start_transaction_under_autocommit = lambda: connection.cursor().execute("BEGIN IMMEDIATE")
+    try:
+        with transaction.atomic(using=using):
+            yield
+    finally:
+        connection.__dict__.pop("_start_transaction_under_autocommit", None)
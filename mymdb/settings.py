@@ -42,6 +42,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "mymdb.apps.MymdbConfig",
     "movies.apps.MoviesConfig",
 ]
 
@@ -87,6 +88,29 @@ DATABASES = {
     }
 }
 
+# Applied to every SQLite connection by mymdb.db
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 20_000,
+    "cache_size": -64_000,
+    "mmap_size": 256 * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
+
+
+# Cache
+# File based by default, so the imports, which run in their own process,
+# invalidate what the web server cached; see movies.caching
+
+CACHES = {
+    "default": {
+        "BACKEND": get_env("CACHE_BACKEND", "django.core.cache.backends.filebased.FileBasedCache"),
+        "LOCATION": get_env("CACHE_LOCATION", os.path.join(BASE_DIR, "cache")),
+    }
+}
+CATALOG_CACHE_TIMEOUT = int(get_env("CATALOG_CACHE_TIMEOUT", 5 * 60))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
@@ -121,6 +145,18 @@ USE_TZ = True
 STATIC_URL = "/static/"
 STATIC_ROOT = None if DEBUG else os.path.join(BASE_DIR, "static")
 
+MEDIA_URL = "/media/"
+MEDIA_ROOT = get_env("MEDIA_ROOT", os.path.join(BASE_DIR, "media"))
+
+# Local poster copies, see movies.posters
+POSTER_THUMBNAIL_SIZE = (120, 180)
+POSTER_DOWNLOAD_CONCURRENCY = 4
+
 # OMDB API
 OMDB_API_URL = "http://www.omdbapi.com/"
 OMDB_API_KEY = get_env("OMDB_API_KEY", "key")
+
+# Metadata cache
+METADATA_CACHE_PATH = get_env("METADATA_CACHE_PATH", os.path.join(BASE_DIR, "metadata.sqlite3"))
+METADATA_CACHE_TTL = int(get_env("METADATA_CACHE_TTL", 30 * 24 * 60 * 60))
+METADATA_CACHE_MAX_ENTRIES = int(get_env("METADATA_CACHE_MAX_ENTRIES", 100_000))
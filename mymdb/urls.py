@@ -13,9 +13,17 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
-from django.urls import path
+from django.urls import include, path
+
+from movies.views import poster
 
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("api/", include("movies.urls")),
 ]
+
+if settings.DEBUG:
+    # In production the web server serves MEDIA_ROOT, see movies.views.poster
+    urlpatterns.append(path("media/posters/<path:path>", poster, name="poster"))